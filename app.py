@@ -1,16 +1,81 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
+from flask import before_render_template, template_rendered
 import sqlite3
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import csv
+import io
+import queue
+import random
+import threading
+import json
+import hashlib
+import time
+import zlib
+import click
+from collections import OrderedDict
 from functools import wraps
 from datetime import datetime, timedelta, date
 
-from init_db import init_db
+from init_db import (
+    bump_cache_version,
+    ensure_exercise_ids,
+    exercise_key,
+    exercise_usage_version_key,
+    exercises_version_key,
+    init_db,
+    rebuild_daily_stats,
+    rebuild_exercise_stats,
+)
+from importer import IMPORT_FORMATS, detect_format, import_workouts, rebuild_user_stats
+from jobs import JobRunner, enqueue, job_handler, job_summary, run_one
+from passwords import HashPool, HashPoolBusy, default_workers
+from series import lttb_indices
+from suggest import PrefixIndex, suggest
+from metrics import (
+    MetricsRegistry,
+    TracedConnection,
+    current_sample,
+    end_sample,
+    set_current_route,
+    slow_queries,
+    start_sample,
+)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "dev_secret_change_me")
 DATABASE = os.getenv("DATABASE_PATH", "database.db")
+# Conexiones ociosas que conserva cada worker (por proceso).
+DB_POOL_SIZE = max(1, int(os.getenv("DB_POOL_SIZE", "8")))
+# Fraccion de requests instrumentados (0 desactiva) y token para /metrics.
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Consultas mas lentas que esto (ms) van al log con su EXPLAIN QUERY PLAN (0 desactiva).
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
 ADMIN_BOOTSTRAP_USERNAMES = {"DraxsTg"}
+# Hash de contrasenas (formato werkzeug); al cambiarlo, cada usuario se re-hashea en su
+# siguiente login. Procesos por worker (0: en linea; por defecto 1 solo con workers
+# gthread de gunicorn, ver passwords.default_workers) y operaciones en vuelo/espera.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(default_workers())))
+PASSWORD_HASH_MAX_PENDING = max(1, int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16")))
+# Hilos por worker que ejecutan trabajos en segundo plano (0: solo `flask run-jobs`).
+JOB_THREADS = int(os.getenv("JOB_THREADS", "2"))
+# Tope de dias que recorre smart_streak (si todo es descanso, no hay bucle infinito).
+STREAK_MAX_DAYS = 3650
+# Cache de estado admin y de cuentas vivas por worker: otros workers ven altas/bajas
+# y purgas como mucho ADMIN_CACHE_TTL segundos tarde (admin_required siempre consulta).
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "30"))
+ADMIN_CACHE_MAX = 10000
+# Tope (bytes aproximados, JSON) de la cache de dashboards por worker.
+DASHBOARD_CACHE_BYTES = int(os.getenv("DASHBOARD_CACHE_BYTES", str(8 * 1024 * 1024)))
+# Tope de ejercicios (sumando usuarios) en los indices de autocompletado por worker.
+SUGGEST_CACHE_EXERCISES = int(os.getenv("SUGGEST_CACHE_EXERCISES", "200000"))
+# Resultados de /api/exercises/suggest y chips "Tus ejercicios" en /session/new.
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+SESSION_CHIP_EXERCISES = 24
+# Usuarios con sugerencias de /session/new cacheadas por worker (LRU).
+SUGGESTIONS_CACHE_USERS = int(os.getenv("SUGGESTIONS_CACHE_USERS", "4096"))
 
 MUSCLES = [
     {"slug": "pectorales", "name": "Pectorales"},
@@ -83,13 +148,100 @@ RECOMMENDED_ROUTINES = [
 
 
 
-def get_db():
-    conn = sqlite3.connect(DATABASE, timeout=10)
+_db_pool: queue.LifoQueue = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_db_pool_pid = os.getpid()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Abre una conexion nueva y aplica los PRAGMAs una sola vez.
+    """
+    conn = sqlite3.connect(DATABASE, timeout=10, check_same_thread=False, factory=TracedConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -16000")
+    conn.execute("PRAGMA mmap_size = 134217728")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
 
+def _acquire_db() -> sqlite3.Connection:
+    global _db_pool, _db_pool_pid
+    if _db_pool_pid != os.getpid():
+        # Tras un fork (gunicorn --preload) no se comparten conexiones del padre.
+        _db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+        _db_pool_pid = os.getpid()
+    try:
+        return _db_pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+
+def _release_db(conn: sqlite3.Connection) -> None:
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Conexion compartida durante el request (o el app context actual).
+    Se devuelve al pool en teardown; no hay que cerrarla a mano.
+    """
+    if "db" not in g:
+        g.db = _acquire_db()
+    return g.db
+
+
+request_metrics = MetricsRegistry()
+password_pool = HashPool(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+slow_queries.threshold_ms = SLOW_QUERY_MS
+
+
+@app.before_request
+def start_request_metrics() -> None:
+    set_current_route(request.endpoint)
+    if METRICS_SAMPLE_RATE > 0 and random.random() < METRICS_SAMPLE_RATE:
+        start_sample()
+
+
+@app.teardown_request
+def finish_request_metrics(exc: BaseException | None) -> None:
+    set_current_route(None)
+    sample = end_sample()
+    if sample is not None and request.endpoint != "static":
+        request_metrics.record(request.endpoint or "not_found", sample)
+
+
+def _render_started(sender, template, context, **extra) -> None:
+    sample = current_sample()
+    if sample is not None:
+        sample.render_start = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra) -> None:
+    sample = current_sample()
+    if sample is not None and sample.render_start:
+        sample.render_s += time.perf_counter() - sample.render_start
+        sample.render_start = 0.0
+
+
+before_render_template.connect(_render_started, app)
+template_rendered.connect(_render_finished, app)
+
+
+@app.teardown_appcontext
+def release_db(exc: BaseException | None) -> None:
+    conn = g.pop("db", None)
+    if conn is not None:
+        _release_db(conn)
+
+
 def iso_today() -> str:
     return date.today().isoformat()
 
@@ -108,16 +260,28 @@ def safe_float(value, default=0.0) -> float:
         return default
 
 
+def parse_iso_date(value, default: date) -> date:
+    try:
+        return date.fromisoformat((value or "").strip()[:10])
+    except ValueError:
+        return default
+
+
 def parse_days_csv(value: str) -> set[str]:
     return {v for v in (value or "").split(",") if v}
 
 
+# Parte fija de build_suggestions(), calculada una vez. Solo lectura: se comparte entre usuarios.
+SUGGESTIONS_STATIC = {
+    "Todos": sorted({ex for items in MUSCLE_SUGGESTIONS_BASE.values() for ex in items}),
+    **{k: list(v) for k, v in MUSCLE_SUGGESTIONS_BASE.items()},
+}
+
+
 def build_suggestions(user_exercises: list[str]) -> dict[str, list[str]]:
-    suggestions = {k: list(v) for k, v in MUSCLE_SUGGESTIONS_BASE.items()}
-    all_sugs = sorted({ex for items in suggestions.values() for ex in items})
-    if user_exercises:
-        suggestions["Tus ejercicios"] = sorted(set(user_exercises))
-    return {"Todos": all_sugs, **suggestions}
+    if not user_exercises:
+        return SUGGESTIONS_STATIC
+    return {**SUGGESTIONS_STATIC, "Tus ejercicios": sorted(set(user_exercises))}
 
 
 def parse_rest_days(rest_days_str: str) -> set[int]:
@@ -139,11 +303,10 @@ def today_dow_sun0(d: date | None = None) -> int:
     return (d.weekday() + 1) % 7
 
 
-def ensure_user_settings(user_id: int) -> sqlite3.Row:
+def ensure_user_settings(db: sqlite3.Connection, user_id: int) -> sqlite3.Row:
     """
     Si no existe settings para el usuario, lo crea con defaults.
     """
-    db = get_db()
     row = db.execute("SELECT * FROM user_settings WHERE user_id = ?", (user_id,)).fetchone()
     if not row:
         db.execute(
@@ -152,56 +315,155 @@ def ensure_user_settings(user_id: int) -> sqlite3.Row:
         )
         db.commit()
         row = db.execute("SELECT * FROM user_settings WHERE user_id = ?", (user_id,)).fetchone()
-    db.close()
     return row
 
 
-def get_user_exercises(user_id: int) -> list[str]:
-    db = get_db()
+def get_user_exercises(db: sqlite3.Connection, user_id: int) -> list[str]:
     rows = db.execute(
         "SELECT name FROM exercises WHERE user_id = ? ORDER BY name ASC",
         (user_id,),
     ).fetchall()
-    db.close()
     return [r["name"] for r in rows]
 
 
-def get_user_routines(user_id: int) -> list[str]:
-    db = get_db()
+def get_recent_exercises(db: sqlite3.Connection, user_id: int, limit: int) -> list[str]:
+    """
+    Los ultimos `limit` ejercicios creados por el usuario.
+    """
+    rows = db.execute(
+        "SELECT name FROM exercises WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+        (user_id, limit),
+    ).fetchall()
+    return [r["name"] for r in rows]
+
+
+def get_user_routines(db: sqlite3.Connection, user_id: int) -> list[str]:
     rows = db.execute(
         "SELECT name FROM routines WHERE user_id = ? ORDER BY id DESC",
         (user_id,),
     ).fetchall()
-    db.close()
     return [r["name"] for r in rows]
 
 
-def ensure_exercise(db: sqlite3.Connection, user_id: int, name: str) -> None:
-    name = (name or "").strip()
-    if not name:
-        return
-    db.execute(
-        "INSERT OR IGNORE INTO exercises (user_id, name) VALUES (?, ?)",
-        (user_id, name),
-    )
+def parse_set_rows(
+    exercise_list: list[str],
+    sets_list: list[str],
+    reps_list: list[str],
+    weight_list: list[str],
+    note_list: list[str],
+) -> list[tuple[str, int, int, float, str]]:
+    """
+    Filas del formulario de sesion -> (ejercicio, sets, reps, peso, nota).
+    Omite filas sin ejercicio.
+    """
+    rows = []
+    for i, ex in enumerate(exercise_list):
+        name = (ex or "").strip()
+        if not name:
+            continue
+        sets_count = safe_int(sets_list[i] if i < len(sets_list) else 1, 1)
+        reps = safe_int(reps_list[i] if i < len(reps_list) else 0, 0)
+        weight = safe_float(weight_list[i] if i < len(weight_list) else 0, 0.0)
+        set_note = (note_list[i] if i < len(note_list) else "").strip()
+        rows.append((name, max(1, sets_count), reps, weight, set_note))
+    return rows
 
 
-def table_has_column(db: sqlite3.Connection, table: str, column: str) -> bool:
-    rows = db.execute(f"PRAGMA table_info({table})").fetchall()
-    return any(r[1] == column for r in rows)
+def summarize_set_rows(rows: list[tuple[int, int, int, float, str]]) -> tuple[float, dict[int, dict]]:
+    """
+    Volumen total y totales por exercise_id (para user_daily_stats y exercise_stats).
+    """
+    volume = 0.0
+    totals: dict[int, dict] = {}
+    for exercise_id, sets_count, reps, weight, _ in rows:
+        row_volume = weight * reps * sets_count
+        volume += row_volume
+        t = totals.setdefault(exercise_id, {"best_weight": 0.0, "best_e1rm": 0.0, "volume": 0.0})
+        t["best_weight"] = max(t["best_weight"], weight)
+        t["best_e1rm"] = max(t["best_e1rm"], weight * (1 + reps / 30.0))
+        t["volume"] += row_volume
+    return volume, totals
 
 
-def is_admin_user(user_id: int) -> bool:
-    db = get_db()
+def get_cache_version(db: sqlite3.Connection, key: str) -> int:
+    row = db.execute("SELECT version FROM cache_versions WHERE key = ?", (key,)).fetchone()
+    return int(row["version"]) if row else 0
+
+
+def get_user_data_version(db: sqlite3.Connection, user_id: int) -> int:
+    return get_cache_version(db, f"user:{user_id}")
+
+
+def bump_user_data_version(db: sqlite3.Connection, user_id: int) -> None:
+    """
+    Llamar en la misma transaccion que cualquier cambio de datos del usuario.
+    """
+    bump_cache_version(db, f"user:{user_id}")
+
+
+def is_admin_user(db: sqlite3.Connection, user_id: int) -> bool:
     row = db.execute("SELECT 1 FROM admins WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
-    db.close()
     return row is not None
 
 
-def ensure_admin_bootstrap(username: str) -> None:
+# user_id -> (expira_monotonic, es_admin)
+_admin_cache: dict[int, tuple[float, bool]] = {}
+
+
+def cached_is_admin(user_id: int, fresh: bool = False) -> bool:
+    """
+    is_admin_user() con cache TTL por proceso. fresh=True fuerza la consulta.
+    """
+    now = time.monotonic()
+    hit = _admin_cache.get(user_id)
+    if hit and hit[0] > now and not fresh:
+        return hit[1]
+    value = is_admin_user(get_db(), user_id)
+    if len(_admin_cache) >= ADMIN_CACHE_MAX:
+        _admin_cache.clear()
+    _admin_cache[user_id] = (now + ADMIN_CACHE_TTL, value)
+    return value
+
+
+# user_id -> expira_monotonic; solo cuentas que existian al consultarlas.
+_user_cache: dict[int, float] = {}
+
+
+def cached_user_exists(user_id: int) -> bool:
+    """
+    Si la cuenta sigue existiendo, con cache TTL por proceso. purge_user la
+    invalida en su worker; no se cachea el negativo (la sesion se limpia).
+    """
+    now = time.monotonic()
+    if _user_cache.get(user_id, 0.0) > now:
+        return True
+    if get_db().execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+        return False
+    if len(_user_cache) >= ADMIN_CACHE_MAX:
+        _user_cache.clear()
+    _user_cache[user_id] = now + ADMIN_CACHE_TTL
+    return True
+
+
+def invalidate_admin_cache(user_id: int) -> None:
+    _admin_cache.pop(user_id, None)
+    g.pop("is_admin", None)
+
+
+def current_user_is_admin(fresh: bool = False) -> bool:
+    """
+    Estado admin del usuario en sesion, resuelto una vez por request.
+    """
+    if "user_id" not in session:
+        return False
+    if fresh or "is_admin" not in g:
+        g.is_admin = cached_is_admin(int(session["user_id"]), fresh=fresh)
+    return g.is_admin
+
+
+def ensure_admin_bootstrap(db: sqlite3.Connection, username: str) -> None:
     if not username or username not in ADMIN_BOOTSTRAP_USERNAMES:
         return
-    db = get_db()
     user = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
     if user:
         db.execute(
@@ -209,7 +471,7 @@ def ensure_admin_bootstrap(username: str) -> None:
             (user["id"], datetime.utcnow().isoformat()),
         )
         db.commit()
-    db.close()
+        invalidate_admin_cache(user["id"])
 
 
 def admin_required(view):
@@ -218,7 +480,7 @@ def admin_required(view):
         if "user_id" not in session:
             flash("Debes iniciar sesion primero.")
             return redirect(url_for("login"))
-        if not is_admin_user(int(session["user_id"])):
+        if not current_user_is_admin(fresh=True):
             flash("No tienes permisos de administrador.")
             return redirect(url_for("dashboard"))
         return view(*args, **kwargs)
@@ -228,12 +490,10 @@ def admin_required(view):
 
 @app.context_processor
 def inject_admin_flag():
-    is_admin = False
-    if "user_id" in session:
-        try:
-            is_admin = is_admin_user(int(session["user_id"]))
-        except Exception:
-            is_admin = False
+    try:
+        is_admin = current_user_is_admin()
+    except Exception:
+        is_admin = False
     return {"is_admin": is_admin}
 
 
@@ -241,12 +501,144 @@ def inject_admin_flag():
 init_db(DATABASE)
 
 
+@app.cli.command("rebuild-stats")
+@click.option("--user-id", type=int, default=None, help="Solo este usuario.")
+def rebuild_stats_command(user_id: int | None) -> None:
+    """Recalcula user_daily_stats y exercise_stats desde workouts/sets."""
+    db = get_db()
+    rebuild_daily_stats(db, user_id)
+    rebuild_exercise_stats(db, user_id)
+    db.commit()
+    click.echo("user_daily_stats y exercise_stats reconstruidos.")
+
+
+@app.cli.command("import-workouts")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--username", required=True, help="Usuario destino.")
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS), default=None, help="Por defecto, segun la extension.")
+@click.option("--chunk-sets", type=int, default=5000, help="Sets por transaccion.")
+def import_workouts_command(path: str, username: str, fmt: str | None, chunk_sets: int) -> None:
+    """Importa sesiones desde un CSV, JSON o NDJSON."""
+    fmt = fmt or detect_format(path)
+    if not fmt:
+        raise click.UsageError("No se pudo deducir el formato; usa --format.")
+    db = get_db()
+    user = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    if not user:
+        raise click.UsageError(f"Usuario no encontrado: {username}")
+
+    def report(counts: dict) -> None:
+        click.echo(f"  {counts['workouts']} sesiones, {counts['sets']} sets...")
+
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            counts = import_workouts(db, user["id"], stream, fmt, chunk_sets=chunk_sets, on_progress=report)
+    finally:
+        bump_user_data_version(db, user["id"])
+        db.commit()
+    click.echo(f"Importadas {counts['workouts']} sesiones y {counts['sets']} sets ({counts['skipped']} omitidos).")
+
+
+@job_handler("rebuild_user_stats")
+def rebuild_user_stats_job(db: sqlite3.Connection, payload: dict) -> None:
+    user_id = int(payload["user_id"])
+    rebuild_user_stats(db, user_id)
+    bump_user_data_version(db, user_id)
+
+
+@job_handler("analyze")
+def analyze_job(db: sqlite3.Connection, payload: dict) -> None:
+    db.execute("ANALYZE")
+
+
+# VACUUM toma el lock de escritura y el heartbeat no puede renovar: lease largo.
+@job_handler("vacuum", lease_s=6 * 3600)
+def vacuum_job(db: sqlite3.Connection, payload: dict) -> None:
+    db.execute("VACUUM")
+
+
+# Filas padre por transaccion al purgar una cuenta (los hijos caen en cascada).
+PURGE_BATCH_SIZE = 200
+# Tabla -> clave para borrar por lotes (las WITHOUT ROWID no tienen rowid).
+PURGE_TABLES = (
+    ("workouts", "id"),
+    ("routines", "id"),
+    ("saved_notes", "id"),
+    ("user_daily_stats", "date"),
+    ("exercise_stats", "exercise_id"),
+    ("exercises", "id"),
+)
+
+
+def purge_user(db: sqlite3.Connection, user_id: int, batch_size: int = PURGE_BATCH_SIZE) -> None:
+    """
+    Borra la cuenta y todo su historial en transacciones cortas, para que una
+    cuenta grande no retenga el lock de escritura. Hace sus propios commits.
+    """
+    for table, key in PURGE_TABLES:
+        while True:
+            cur = db.execute(
+                f"""
+                DELETE FROM {table}
+                WHERE user_id = ? AND {key} IN (SELECT {key} FROM {table} WHERE user_id = ? LIMIT ?)
+                """,
+                (user_id, user_id, batch_size),
+            )
+            db.commit()
+            if cur.rowcount < batch_size:
+                break
+    # Lo que quede (ajustes, admins, tablas viejas) cae en cascada con el usuario.
+    db.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    db.execute(
+        "DELETE FROM cache_versions WHERE key IN (?, ?, ?)",
+        (f"user:{user_id}", exercises_version_key(user_id), exercise_usage_version_key(user_id)),
+    )
+    db.commit()
+    # Corre en el job runner, sin request: no se toca g.
+    _user_cache.pop(user_id, None)
+    _admin_cache.pop(user_id, None)
+
+
+@job_handler("purge_user")
+def purge_user_job(db: sqlite3.Connection, payload: dict) -> None:
+    purge_user(db, int(payload["user_id"]))
+
+
+# Trabajos que un admin puede encolar a mano desde /admin/jobs.
+ADMIN_JOB_KINDS = ("analyze", "vacuum", "rebuild_user_stats")
+
+job_runner = JobRunner(_acquire_db, _release_db, threads=JOB_THREADS)
+
+
+@app.before_request
+def start_job_runner() -> None:
+    # Idempotente por proceso: cada worker arranca sus hilos en su primer request
+    # (no al importar, para que un fork con --preload no los pierda).
+    job_runner.start()
+
+
+@app.cli.command("run-jobs")
+def run_jobs_command() -> None:
+    """Ejecuta los trabajos en cola hasta vaciarla (util con JOB_THREADS=0)."""
+    db = get_db()
+    worker = f"cli:{os.getpid()}"
+    ran = 0
+    while run_one(db, worker):
+        ran += 1
+    click.echo(f"{ran} trabajo(s) ejecutado(s).")
+
+
 def login_required(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
         if "user_id" not in session:
             flash("Debes iniciar sesion primero.")
             return redirect(url_for("login"))
+        # La cuenta pudo ser eliminada (purge) con la cookie aun vigente.
+        if not cached_user_exists(int(session["user_id"])):
+            session.clear()
+            flash("Debes iniciar sesion primero.")
+            return redirect(url_for("login"))
         return view(*args, **kwargs)
 
     return wrapped
@@ -273,7 +665,11 @@ def register():
             flash("Completa todos los campos.")
             return render_template("register.html")
 
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = password_pool.hash(password)
+        except HashPoolBusy:
+            flash("Servidor ocupado. Intenta de nuevo en unos segundos.")
+            return render_template("register.html"), 503
 
         db = get_db()
         try:
@@ -303,8 +699,6 @@ def register():
             flash("Usuario o correo ya existe.")
         except Exception:
             flash("Error inesperado. Intenta de nuevo.")
-        finally:
-            db.close()
 
     return render_template("register.html")
 
@@ -328,12 +722,26 @@ def login():
             "SELECT id, username, password FROM users WHERE username = ?",
             (username,),
         ).fetchone()
-        db.close()
 
-        if user and check_password_hash(user["password"], password):
+        try:
+            valid = bool(user) and password_pool.verify(user["password"], password)
+        except HashPoolBusy:
+            flash("Servidor ocupado. Intenta de nuevo en unos segundos.")
+            return render_template("login.html"), 503
+
+        if valid:
+            if password_pool.needs_rehash(user["password"]):
+                try:
+                    db.execute(
+                        "UPDATE users SET password = ? WHERE id = ?",
+                        (password_pool.hash(password), user["id"]),
+                    )
+                    db.commit()
+                except HashPoolBusy:
+                    pass  # Se reintenta en el proximo login.
             session["user_id"] = user["id"]
             session["username"] = user["username"]
-            ensure_admin_bootstrap(user["username"])
+            ensure_admin_bootstrap(db, user["username"])
             return redirect(url_for("dashboard"))
         else:
             flash("Usuario o contrasena incorrectos.")
@@ -343,37 +751,78 @@ def login():
 
 
 
-def workouts_count_between(user_id: int, start_iso: str, end_iso: str) -> int:
-    db = get_db()
-    row = db.execute(
+def bump_daily_stats(
+    db: sqlite3.Connection, user_id: int, day_iso: str, sessions: int, volume: float, duration_min: int
+) -> None:
+    """
+    Suma al resumen diario (user_daily_stats). Sin commit: va en la
+    transaccion del llamador.
+    """
+    db.execute(
         """
-        SELECT COUNT(*) as c
-        FROM workouts
-        WHERE user_id = ? AND date BETWEEN ? AND ?
+        INSERT INTO user_daily_stats (user_id, date, sessions, volume, duration_min)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, date) DO UPDATE SET
+            sessions = sessions + excluded.sessions,
+            volume = volume + excluded.volume,
+            duration_min = duration_min + excluded.duration_min
         """,
-        (user_id, start_iso, end_iso),
-    ).fetchone()
-    db.close()
-    return int(row["c"] or 0)
+        (user_id, day_iso, sessions, volume, duration_min),
+    )
 
 
-def volume_between(user_id: int, start_iso: str, end_iso: str) -> float:
-    db = get_db()
-    row = db.execute(
+def update_exercise_stats(db: sqlite3.Connection, user_id: int, day_iso: str, totals: dict[int, dict]) -> list[int]:
+    """
+    Suma una sesion a exercise_stats (sin commit).
+    totals: exercise_id -> {"best_weight", "best_e1rm", "volume"} de la sesion.
+    Devuelve los exercise_id ya registrados que superan su mejor e1RM.
+    """
+    if not totals:
+        return []
+    placeholders = ",".join("?" * len(totals))
+    previous = {
+        r["exercise_id"]: float(r["best_e1rm"] or 0)
+        for r in db.execute(
+            f"SELECT exercise_id, best_e1rm FROM exercise_stats WHERE user_id = ? AND exercise_id IN ({placeholders})",
+            [user_id, *totals],
+        )
+    }
+    db.executemany(
         """
-        SELECT COALESCE(SUM(s.weight * s.reps * s.sets), 0) as vol
-        FROM sets s
-        JOIN workouts w ON w.id = s.workout_id
-        WHERE w.user_id = ? AND w.date BETWEEN ? AND ?
+        INSERT INTO exercise_stats (user_id, exercise_id, best_weight, best_e1rm, best_e1rm_date, volume, last_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, exercise_id) DO UPDATE SET
+            best_weight = MAX(best_weight, excluded.best_weight),
+            best_e1rm_date = CASE
+                WHEN excluded.best_e1rm > best_e1rm THEN excluded.best_e1rm_date
+                WHEN excluded.best_e1rm = best_e1rm AND excluded.best_e1rm_date < best_e1rm_date
+                    THEN excluded.best_e1rm_date
+                ELSE best_e1rm_date
+            END,
+            best_e1rm = MAX(best_e1rm, excluded.best_e1rm),
+            volume = volume + excluded.volume,
+            last_date = MAX(last_date, excluded.last_date)
+        """,
+        [
+            (user_id, exercise_id, t["best_weight"], t["best_e1rm"], day_iso, t["volume"], day_iso)
+            for exercise_id, t in totals.items()
+        ],
+    )
+    return [i for i, t in totals.items() if i in previous and t["best_e1rm"] > previous[i]]
+
+
+def daily_stats_between(db: sqlite3.Connection, user_id: int, start_iso: str, end_iso: str) -> list[sqlite3.Row]:
+    return db.execute(
+        """
+        SELECT date, sessions, volume, duration_min
+        FROM user_daily_stats
+        WHERE user_id = ? AND date BETWEEN ? AND ?
         """,
         (user_id, start_iso, end_iso),
-    ).fetchone()
-    db.close()
-    return float(row["vol"] or 0.0)
+    ).fetchall()
 
 
-def last_workout_date(user_id: int) -> str | None:
-    db = get_db()
+def last_workout_date(db: sqlite3.Connection, user_id: int) -> str | None:
     row = db.execute(
         """
         SELECT date
@@ -384,48 +833,51 @@ def last_workout_date(user_id: int) -> str | None:
         """,
         (user_id,),
     ).fetchone()
-    db.close()
     return row["date"] if row else None
 
 
-def smart_streak(user_id: int, rest_days: set[int]) -> int:
+def smart_streak(db: sqlite3.Connection, user_id: int, rest_days: set[int], today: date | None = None) -> int:
     """
     Racha inteligente:
     - Cuenta dias consecutivos hacia atras donde:
       (hubo entrenamiento) OR (era dia de descanso programado)
     - Se rompe si: NO es descanso y NO hay entrenamiento ese dia.
+    - Una sola consulta (dias entrenados en user_daily_stats, de hoy hacia atras) que se
+      consume solo hasta donde llega la racha. Tope: STREAK_MAX_DAYS.
     """
-    db = get_db()
-    streak = 0
-    day = date.today()
+    day = today or date.today()
+    floor = day - timedelta(days=STREAK_MAX_DAYS - 1)
+    rows = db.execute(
+        """
+        SELECT date
+        FROM user_daily_stats
+        WHERE user_id = ? AND date BETWEEN ? AND ? AND sessions > 0
+        ORDER BY date DESC
+        """,
+        (user_id, floor.isoformat(), day.isoformat()),
+    )
+    trained_dates = (r["date"] for r in rows)
+    next_trained = next(trained_dates, None)
 
-    while True:
+    streak = 0
+    while streak < STREAK_MAX_DAYS:
         iso = day.isoformat()
-        dow = today_dow_sun0(day)
+        while next_trained is not None and next_trained > iso:
+            next_trained = next(trained_dates, None)
 
-        trained = (
-            db.execute(
-                "SELECT 1 FROM workouts WHERE user_id = ? AND date = ? LIMIT 1",
-                (user_id, iso),
-            ).fetchone()
-            is not None
-        )
+        trained = next_trained == iso
+        is_rest = today_dow_sun0(day) in rest_days
 
-        is_rest = dow in rest_days
+        if not (trained or is_rest):
+            break
 
-        if trained or is_rest:
-            streak += 1
-            day = day - timedelta(days=1)
-            continue
-
-        break
+        streak += 1
+        day = day - timedelta(days=1)
 
-    db.close()
     return streak
 
 
-def recent_activity(user_id: int, limit: int = 5) -> list[dict]:
-    db = get_db()
+def recent_activity(db: sqlite3.Connection, user_id: int, limit: int = 5) -> list[dict]:
     rows = db.execute(
         """
         SELECT id, date, duration_min, note
@@ -446,7 +898,6 @@ def recent_activity(user_id: int, limit: int = 5) -> list[dict]:
                 "note": (r["note"] or "").strip(),
             }
         )
-    db.close()
     return items
 
 
@@ -460,13 +911,11 @@ def default_notes() -> list[str]:
     ]
 
 
-def get_notes_for_user(user_id: int) -> list[str]:
-    db = get_db()
+def get_notes_for_user(db: sqlite3.Connection, user_id: int) -> list[str]:
     rows = db.execute(
         "SELECT text FROM saved_notes WHERE user_id = ? ORDER BY id DESC LIMIT 10",
         (user_id,),
     ).fetchall()
-    db.close()
 
     saved = [r["text"] for r in rows if r["text"]]
     base = default_notes()
@@ -478,24 +927,23 @@ def get_notes_for_user(user_id: int) -> list[str]:
 
 
 
-@app.route("/dashboard")
-@login_required
-def dashboard():
-    user_id = int(session["user_id"])
-    settings = ensure_user_settings(user_id)
+def build_dashboard(db: sqlite3.Connection, user_id: int, today: date) -> dict:
+    settings = ensure_user_settings(db, user_id)
     rest_days = parse_rest_days(settings["rest_days"])
     weekly_min = int(settings["weekly_min_sessions"] or 3)
 
-    today = date.today()
     end7 = today.isoformat()
     start7 = (today - timedelta(days=6)).isoformat()
 
-    this7_count = workouts_count_between(user_id, start7, end7)
-    this7_vol = volume_between(user_id, start7, end7)
-
     prev7_end = (today - timedelta(days=7)).isoformat()
     prev7_start = (today - timedelta(days=13)).isoformat()
-    prev7_vol = volume_between(user_id, prev7_start, prev7_end)
+
+    # 14 filas del resumen diario cubren esta semana y la anterior.
+    daily = daily_stats_between(db, user_id, prev7_start, end7)
+    this7 = [r for r in daily if r["date"] >= start7]
+    this7_count = sum(int(r["sessions"] or 0) for r in this7)
+    this7_vol = sum(float(r["volume"] or 0) for r in this7)
+    prev7_vol = sum(float(r["volume"] or 0) for r in daily if r["date"] <= prev7_end)
 
     if this7_vol == 0 and prev7_vol == 0:
         trend_label = "Sin datos"
@@ -513,9 +961,9 @@ def dashboard():
         else:
             trend_label = "Estable"
 
-    streak = smart_streak(user_id, rest_days)
+    streak = smart_streak(db, user_id, rest_days, today=today)
 
-    last_date = last_workout_date(user_id)
+    last_date = last_workout_date(db, user_id)
     last_label = "Aun no registras"
     if last_date:
         d0 = datetime.strptime(last_date, "%Y-%m-%d").date()
@@ -540,128 +988,324 @@ def dashboard():
         next_step = "Completar semana"
         next_step_sub = f"Te faltan {falta} sesion(es) para tu meta."
 
-    notes = get_notes_for_user(user_id)
-    activity = recent_activity(user_id, limit=6)
-
-    stats = {
-        "streak": streak,
-        "sessions_7d": this7_count,
-        "volume_7d": round(this7_vol, 1),
-        "trend_label": trend_label,
-        "trend_pct": trend_pct,
-        "last_label": last_label,
+    return {
+        "stats": {
+            "streak": streak,
+            "sessions_7d": this7_count,
+            "volume_7d": round(this7_vol, 1),
+            "trend_label": trend_label,
+            "trend_pct": trend_pct,
+            "last_label": last_label,
+        },
+        "focus": {
+            "chip": day_chip,
+            "action_title": action_title,
+            "action_sub": action_sub,
+            "next_step": next_step,
+            "next_step_sub": next_step_sub,
+        },
+        "notes": get_notes_for_user(db, user_id),
+        "activity": recent_activity(db, user_id, limit=6),
     }
 
-    focus = {
-        "chip": day_chip,
-        "action_title": action_title,
-        "action_sub": action_sub,
-        "next_step": next_step,
-        "next_step_sub": next_step_sub,
-    }
 
+# user_id -> (version, dia, bytes, payload); LRU acotada por bytes aproximados.
+_dashboard_cache: "OrderedDict[int, tuple[int, str, int, dict]]" = OrderedDict()
+_dashboard_cache_bytes = 0
+_dashboard_cache_lock = threading.Lock()
+
+
+def get_dashboard_payload(
+    db: sqlite3.Connection, user_id: int, today: date | None = None, version: int | None = None
+) -> tuple[dict, int]:
+    """
+    build_dashboard() cacheado por (user_id, data version, dia).
+    Devuelve (payload, version); en un acierto solo se lee la version.
+    """
+    global _dashboard_cache_bytes
+    today = today or date.today()
+    day = today.isoformat()
+    if version is None:
+        version = get_user_data_version(db, user_id)
+
+    with _dashboard_cache_lock:
+        hit = _dashboard_cache.get(user_id)
+        if hit and hit[0] == version and hit[1] == day:
+            _dashboard_cache.move_to_end(user_id)
+            return hit[3], version
+
+    payload = build_dashboard(db, user_id, today)
+    size = len(json.dumps(payload))
+
+    with _dashboard_cache_lock:
+        old = _dashboard_cache.pop(user_id, None)
+        if old:
+            _dashboard_cache_bytes -= old[2]
+        _dashboard_cache[user_id] = (version, day, size, payload)
+        _dashboard_cache_bytes += size
+        while _dashboard_cache_bytes > DASHBOARD_CACHE_BYTES and len(_dashboard_cache) > 1:
+            _, evicted = _dashboard_cache.popitem(last=False)
+            _dashboard_cache_bytes -= evicted[2]
+    return payload, version
+
+
+@app.route("/dashboard")
+@login_required
+def dashboard():
+    user_id = int(session["user_id"])
+    today = date.today()
+    payload, version = get_dashboard_payload(get_db(), user_id, today)
     return render_template(
         "dashboard.html",
+        etag=dashboard_etag(user_id, version, today),
         username=session.get("username", "Usuario"),
-        stats=stats,
-        focus=focus,
-        notes=notes,
-        activity=activity,
+        stats=payload["stats"],
+        focus=payload["focus"],
+        notes=payload["notes"],
+        activity=payload["activity"],
     )
 
 
+def dashboard_etag(user_id: int, version: int, today: date) -> str:
+    return f"u{user_id}-v{version}-{today.isoformat()}"
+
+
+@app.route("/api/dashboard")
+@login_required
+def api_dashboard():
+    """
+    Mismo payload que dashboard() en JSON. El ETag sale de la data version y
+    el dia, asi un 304 cuesta una sola consulta.
+    """
+    user_id = int(session["user_id"])
+    db = get_db()
+    today = date.today()
+    version = get_user_data_version(db, user_id)
+    etag = dashboard_etag(user_id, version, today)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if request.if_none_match.contains(etag):
+        return "", 304, headers
+
+    payload, _ = get_dashboard_payload(db, user_id, today, version)
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return app.response_class(body, mimetype="application/json", headers=headers)
+
+
+
+MUSCLE_SLUG_MAP = {m["slug"]: m["name"] for m in MUSCLES}
+
+_suggestions_cache: "OrderedDict[int, tuple[int, dict]]" = OrderedDict()
+_suggestions_cache_lock = threading.Lock()
+
+
+def get_session_suggestions(db: sqlite3.Connection, user_id: int) -> dict[str, list[str]]:
+    """
+    build_suggestions() del usuario, cacheado por la version de su conjunto de
+    ejercicios: solo cambia cuando ensure_exercise_ids inserta uno nuevo.
+    """
+    version = get_cache_version(db, exercises_version_key(user_id))
+    with _suggestions_cache_lock:
+        hit = _suggestions_cache.get(user_id)
+        if hit and hit[0] == version:
+            _suggestions_cache.move_to_end(user_id)
+            return hit[1]
+
+    # El resto de ejercicios llega por /api/exercises/suggest; la pagina no crece con el historial.
+    suggestions = build_suggestions(get_recent_exercises(db, user_id, SESSION_CHIP_EXERCISES))
+
+    with _suggestions_cache_lock:
+        _suggestions_cache[user_id] = (version, suggestions)
+        _suggestions_cache.move_to_end(user_id)
+        while len(_suggestions_cache) > SUGGESTIONS_CACHE_USERS:
+            _suggestions_cache.popitem(last=False)
+    return suggestions
+
+
+def render_session_form(db: sqlite3.Connection, user_id: int):
+    return render_template(
+        "session.html",
+        routines=get_user_routines(db, user_id),
+        suggestions=get_session_suggestions(db, user_id),
+        muscle_slug_map=MUSCLE_SLUG_MAP,
+        today=iso_today(),
+    )
+
 
 @app.route("/session/new", methods=["GET", "POST"])
 @login_required
 def register_session():
     user_id = int(session["user_id"])
-    exercises = get_user_exercises(user_id)
-    routines = get_user_routines(user_id)
-    suggestions = build_suggestions(exercises)
-    exercise_options = sorted({ex for ex in exercises} | {ex for items in suggestions.values() for ex in items})
-    muscle_slug_map = {m["slug"]: m["name"] for m in MUSCLES}
+    db = get_db()
 
     if request.method == "POST":
-        workout_date = request.form.get("date", "").strip() or iso_today()
+        # Validada aqui: las series y el calendario asumen fechas ISO.
+        workout_date = parse_iso_date(request.form.get("date"), date.today()).isoformat()
         duration_min = safe_int(request.form.get("duration_min", "0"), 0)
         note = request.form.get("note", "").strip()
         routine = (request.form.get("routine") or "Libre").strip()
 
-        exercise_list = request.form.getlist("exercise[]")
-        sets_list = request.form.getlist("sets[]")
-        reps_list = request.form.getlist("reps[]")
-        weight_list = request.form.getlist("weight[]")
-        note_list = request.form.getlist("set_note[]")
+        rows = parse_set_rows(
+            request.form.getlist("exercise[]"),
+            request.form.getlist("sets[]"),
+            request.form.getlist("reps[]"),
+            request.form.getlist("weight[]"),
+            request.form.getlist("set_note[]"),
+        )
 
-        has_rows = any((e or "").strip() for e in exercise_list)
-        if not has_rows:
+        if not rows:
             flash("Agrega al menos un ejercicio.")
-            return render_template(
-                "session.html",
-                exercises=exercises,
-                routines=routines,
-                suggestions=suggestions,
-                muscle_slug_map=muscle_slug_map,
-                exercise_options=exercise_options,
-                today=iso_today(),
-            )
+            return render_session_form(db, user_id)
 
-        db = get_db()
-        try:
-            if table_has_column(db, "workouts", "routine"):
-                cur = db.execute(
-                    "INSERT INTO workouts (user_id, date, routine, duration_min, note) VALUES (?, ?, ?, ?, ?)",
-                    (user_id, workout_date, routine or "Libre", duration_min, note),
-                )
-            else:
-                cur = db.execute(
-                    "INSERT INTO workouts (user_id, date, duration_min, note) VALUES (?, ?, ?, ?)",
-                    (user_id, workout_date, duration_min, note),
-                )
-            workout_id = cur.lastrowid
-
-            for i, ex in enumerate(exercise_list):
-                name = (ex or "").strip()
-                if not name:
-                    continue
-                sets_count = safe_int(sets_list[i] if i < len(sets_list) else 1, 1)
-                reps = safe_int(reps_list[i] if i < len(reps_list) else 0, 0)
-                weight = safe_float(weight_list[i] if i < len(weight_list) else 0, 0.0)
-                set_note = (note_list[i] if i < len(note_list) else "").strip()
-
-                ensure_exercise(db, user_id, name)
-                db.execute(
-                    """
-                    INSERT INTO sets (workout_id, exercise, sets, reps, weight, notes)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (workout_id, name, max(1, sets_count), reps, weight, set_note),
-                )
+        # workouts.routine existe desde la migracion v1: no hace falta sondear el esquema.
+        cur = db.execute(
+            "INSERT INTO workouts (user_id, date, routine, duration_min, note) VALUES (?, ?, ?, ?, ?)",
+            (user_id, workout_date, routine or "Libre", duration_min, note),
+        )
+        workout_id = cur.lastrowid
 
-            db.commit()
-        finally:
-            db.close()
+        exercise_ids = ensure_exercise_ids(db, user_id, [r[0] for r in rows])
+        rows = [(exercise_ids[exercise_key(r[0])], *r[1:]) for r in rows]
+        db.executemany(
+            """
+            INSERT INTO sets (workout_id, exercise_id, sets, reps, weight, notes)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(workout_id, *r) for r in rows],
+        )
+        bump_cache_version(db, exercise_usage_version_key(user_id))
 
-        flash("Sesion registrada correctamente.")
+        session_volume, exercise_totals = summarize_set_rows(rows)
+        bump_daily_stats(db, user_id, workout_date, 1, session_volume, duration_min)
+        new_prs = update_exercise_stats(db, user_id, workout_date, exercise_totals)
+        bump_user_data_version(db, user_id)
+        db.commit()
+        if new_prs:
+            # Nombre canonico (exercises.name), no la variante escrita en el formulario.
+            placeholders = ",".join("?" * len(new_prs))
+            names = dict(db.execute(f"SELECT id, name FROM exercises WHERE id IN ({placeholders})", new_prs).fetchall())
+            flash(f"Sesion registrada. Nuevo PR en {', '.join(names[i] for i in new_prs)}.")
+        else:
+            flash("Sesion registrada correctamente.")
         return redirect(url_for("progress"))
 
-    return render_template(
-        "session.html",
-        exercises=exercises,
-        routines=routines,
-        suggestions=suggestions,
-        muscle_slug_map=muscle_slug_map,
-        exercise_options=exercise_options,
-        today=iso_today(),
+    return render_session_form(db, user_id)
+
+
+
+def parse_routine_days(day_labels: list[str], day_exercises: list[str]) -> list[tuple[int, str, list[str]]]:
+    """
+    Formulario de rutina -> [(day_order, etiqueta, ejercicios)], sin dias vacios.
+    """
+    days = []
+    for idx, label in enumerate(day_labels):
+        day_label = (label or "").strip()
+        if not day_label:
+            continue
+        lines = (day_exercises[idx] if idx < len(day_exercises) else "").splitlines()
+        days.append((idx, day_label, [l.strip() for l in lines if l.strip()]))
+    return days
+
+
+def insert_routine_days(
+    db: sqlite3.Connection, user_id: int, routine_id: int, days: list[tuple[int, str, list[str]]]
+) -> None:
+    """
+    Inserta dias y ejercicios de una rutina (sin dias previos) con executemany.
+    """
+    if not days:
+        return
+    db.executemany(
+        "INSERT INTO routine_days (routine_id, day_label, day_order) VALUES (?, ?, ?)",
+        [(routine_id, label, order) for order, label, _ in days],
+    )
+    day_ids = {
+        r["day_order"]: r["id"]
+        for r in db.execute("SELECT id, day_order FROM routine_days WHERE routine_id = ?", (routine_id,))
+    }
+    exercise_ids = ensure_exercise_ids(db, user_id, [ex for _, _, exs in days for ex in exs])
+    db.executemany(
+        "INSERT INTO routine_exercises (routine_day_id, exercise_id) VALUES (?, ?)",
+        [(day_ids[order], exercise_ids[exercise_key(ex)]) for order, _, exs in days for ex in exs],
     )
 
 
+def load_routine_days(db: sqlite3.Connection, routine_id: int) -> list[dict]:
+    """
+    Dias de la rutina con sus ejercicios en una consulta:
+    [{"id", "order", "label", "exercises": [(fila_id, exercise_id, nombre), ...]}] por day_order.
+    """
+    rows = db.execute(
+        """
+        SELECT d.id, d.day_order, d.day_label, re.id AS row_id, re.exercise_id, x.name AS exercise
+        FROM routine_days d
+        LEFT JOIN routine_exercises re ON re.routine_day_id = d.id
+        LEFT JOIN exercises x ON x.id = re.exercise_id
+        WHERE d.routine_id = ?
+        ORDER BY d.day_order, d.id, re.id
+        """,
+        (routine_id,),
+    ).fetchall()
+    days: list[dict] = []
+    for r in rows:
+        if not days or days[-1]["id"] != r["id"]:
+            days.append({"id": r["id"], "order": r["day_order"], "label": r["day_label"], "exercises": []})
+        if r["row_id"] is not None:
+            days[-1]["exercises"].append((r["row_id"], r["exercise_id"], r["exercise"] or ""))
+    return days
+
+
+def sync_routine_days(
+    db: sqlite3.Connection, user_id: int, routine_id: int, days: list[tuple[int, str, list[str]]]
+) -> None:
+    """
+    Lleva los dias guardados a `days` tocando solo lo que cambio (sin commit).
+    Los dias se emparejan por day_order y los ejercicios por posicion, asi el
+    orden por id se mantiene sin reescribir filas iguales.
+    """
+    exercise_ids = ensure_exercise_ids(db, user_id, [ex for _, _, exs in days for ex in exs])
+    wanted = {order: (label, [exercise_ids[exercise_key(ex)] for ex in exs]) for order, label, exs in days}
+    stored: dict[int, dict] = {}
+    drop_days, drop_rows = [], []
+    for d in load_routine_days(db, routine_id):
+        # Dias sobrantes o con day_order repetido (datos viejos) se borran.
+        if d["order"] in wanted and d["order"] not in stored:
+            stored[d["order"]] = d
+        else:
+            drop_days.append(d["id"])
+            drop_rows.extend(row_id for row_id, _, _ in d["exercises"])
+    relabel, change, add = [], [], []
+    for order, (label, ids) in wanted.items():
+        day = stored.get(order)
+        if day is None:
+            continue
+        if day["label"] != label:
+            relabel.append((label, day["id"]))
+        current = day["exercises"]
+        for (row_id, old_id, _), new_id in zip(current, ids):
+            if old_id != new_id:
+                change.append((new_id, row_id))
+        drop_rows.extend(row_id for row_id, _, _ in current[len(ids):])
+        add.extend((day["id"], exercise_id) for exercise_id in ids[len(current):])
+
+    if drop_rows:
+        db.executemany("DELETE FROM routine_exercises WHERE id = ?", [(i,) for i in drop_rows])
+    if drop_days:
+        db.executemany("DELETE FROM routine_days WHERE id = ?", [(i,) for i in drop_days])
+    if relabel:
+        db.executemany("UPDATE routine_days SET day_label = ? WHERE id = ?", relabel)
+    if change:
+        db.executemany("UPDATE routine_exercises SET exercise_id = ? WHERE id = ?", change)
+    if add:
+        db.executemany("INSERT INTO routine_exercises (routine_day_id, exercise_id) VALUES (?, ?)", add)
+    insert_routine_days(db, user_id, routine_id, [d for d in days if d[0] not in stored])
+
 
 @app.route("/routines", methods=["GET", "POST"])
 @login_required
 def routines():
     user_id = int(session["user_id"])
-    exercises = get_user_exercises(user_id)
+    db = get_db()
+    exercises = get_user_exercises(db, user_id)
 
     if request.method == "POST":
         name = (request.form.get("name") or "").strip()
@@ -674,39 +1318,17 @@ def routines():
             flash("Pon un nombre a la rutina.")
             return redirect(url_for("routines"))
 
-        db = get_db()
-        try:
-            cur = db.execute(
-                "INSERT INTO routines (user_id, name, created_at, train_days, rest_days) VALUES (?, ?, ?, ?, ?)",
-                (user_id, name, datetime.utcnow().isoformat(), ",".join(train_days), ",".join(rest_days)),
-            )
-            routine_id = cur.lastrowid
-
-            for idx, label in enumerate(day_labels):
-                day_label = (label or "").strip()
-                if not day_label:
-                    continue
-                cur_day = db.execute(
-                    "INSERT INTO routine_days (routine_id, day_label, day_order) VALUES (?, ?, ?)",
-                    (routine_id, day_label, idx),
-                )
-                day_id = cur_day.lastrowid
-
-                lines = (day_exercises[idx] if idx < len(day_exercises) else "").splitlines()
-                for ex in [l.strip() for l in lines if l.strip()]:
-                    ensure_exercise(db, user_id, ex)
-                    db.execute(
-                        "INSERT INTO routine_exercises (routine_day_id, exercise) VALUES (?, ?)",
-                        (day_id, ex),
-                    )
-
-            db.commit()
-        finally:
-            db.close()
+        cur = db.execute(
+            "INSERT INTO routines (user_id, name, created_at, train_days, rest_days) VALUES (?, ?, ?, ?, ?)",
+            (user_id, name, datetime.utcnow().isoformat(), ",".join(train_days), ",".join(rest_days)),
+        )
+        routine_id = cur.lastrowid
+        insert_routine_days(db, user_id, routine_id, parse_routine_days(day_labels, day_exercises))
+        bump_user_data_version(db, user_id)
+        db.commit()
         flash("Rutina creada.")
         return redirect(url_for("routines"))
 
-    db = get_db()
     routines_rows = db.execute(
         """
         SELECT r.id, r.name,
@@ -717,7 +1339,6 @@ def routines():
         """,
         (user_id,),
     ).fetchall()
-    db.close()
 
     routines_list = [
         {"id": r["id"], "name": r["name"], "days": r["days"]} for r in routines_rows
@@ -735,16 +1356,15 @@ def routines():
 @login_required
 def routine_edit(routine_id: int):
     user_id = int(session["user_id"])
-    exercises = get_user_exercises(user_id)
-
     db = get_db()
+    exercises = get_user_exercises(db, user_id)
+
     routine = db.execute(
         "SELECT id, name, train_days, rest_days FROM routines WHERE id = ? AND user_id = ?",
         (routine_id, user_id),
     ).fetchone()
 
     if not routine:
-        db.close()
         flash("Rutina no encontrada.")
         return redirect(url_for("routines"))
 
@@ -757,60 +1377,29 @@ def routine_edit(routine_id: int):
 
         if not name:
             flash("Pon un nombre a la rutina.")
-            db.close()
             return redirect(url_for("routine_edit", routine_id=routine_id))
 
+        days = parse_routine_days(day_labels, day_exercises)
+        # Lectura del estado guardado + escrituras del diff bajo un mismo lock corto.
+        db.execute("BEGIN IMMEDIATE")
         try:
             db.execute(
                 "UPDATE routines SET name = ?, train_days = ?, rest_days = ? WHERE id = ? AND user_id = ?",
                 (name, ",".join(train_days), ",".join(rest_days), routine_id, user_id),
             )
-
-            db.execute(
-                "DELETE FROM routine_exercises WHERE routine_day_id IN (SELECT id FROM routine_days WHERE routine_id = ?)",
-                (routine_id,),
-            )
-            db.execute("DELETE FROM routine_days WHERE routine_id = ?", (routine_id,))
-
-            for idx, label in enumerate(day_labels):
-                day_label = (label or "").strip()
-                if not day_label:
-                    continue
-                cur_day = db.execute(
-                    "INSERT INTO routine_days (routine_id, day_label, day_order) VALUES (?, ?, ?)",
-                    (routine_id, day_label, idx),
-                )
-                day_id = cur_day.lastrowid
-
-                lines = (day_exercises[idx] if idx < len(day_exercises) else "").splitlines()
-                for ex in [l.strip() for l in lines if l.strip()]:
-                    ensure_exercise(db, user_id, ex)
-                    db.execute(
-                        "INSERT INTO routine_exercises (routine_day_id, exercise) VALUES (?, ?)",
-                        (day_id, ex),
-                    )
-
+            sync_routine_days(db, user_id, routine_id, days)
+            bump_user_data_version(db, user_id)
             db.commit()
-        finally:
-            db.close()
+        except Exception:
+            db.rollback()
+            raise
         flash("Rutina actualizada.")
         return redirect(url_for("routines"))
 
-    days_rows = db.execute(
-        "SELECT id, day_label FROM routine_days WHERE routine_id = ? ORDER BY day_order ASC",
-        (routine_id,),
-    ).fetchall()
-
-    days = []
-    for d in days_rows:
-        ex_rows = db.execute(
-            "SELECT exercise FROM routine_exercises WHERE routine_day_id = ?",
-            (d["id"],),
-        ).fetchall()
-        exercises_text = "\n".join([e["exercise"] for e in ex_rows])
-        days.append({"label": d["day_label"], "exercises": exercises_text})
-
-    db.close()
+    days = [
+        {"label": d["label"], "exercises": "\n".join(name for _, _, name in d["exercises"])}
+        for d in load_routine_days(db, routine_id)
+    ]
 
     return render_template(
         "routine_edit.html",
@@ -827,77 +1416,116 @@ def routine_edit(routine_id: int):
 def routine_delete(routine_id: int):
     user_id = int(session["user_id"])
     db = get_db()
-    db.execute(
-        "DELETE FROM routine_exercises WHERE routine_day_id IN (SELECT id FROM routine_days WHERE routine_id = ?)",
-        (routine_id,),
-    )
-    db.execute("DELETE FROM routine_days WHERE routine_id = ?", (routine_id,))
+    # Dias y ejercicios se van por ON DELETE CASCADE.
     db.execute("DELETE FROM routines WHERE id = ? AND user_id = ?", (routine_id, user_id))
+    bump_user_data_version(db, user_id)
     db.commit()
-    db.close()
     flash("Rutina eliminada.")
     return redirect(url_for("routines"))
 
 
 
+# Sesiones por pagina en /progress (paginacion por (date, id)).
+PROGRESS_PAGE_SIZE = 12
+
+
+def parse_workout_cursor(value: str | None) -> tuple[str, int] | None:
+    """
+    Cursor "YYYY-MM-DD:id" de la ultima sesion mostrada.
+    """
+    if not value or ":" not in value:
+        return None
+    day, _, wid = value.rpartition(":")
+    if not day or not wid.isdigit():
+        return None
+    return day, int(wid)
+
+
+def load_workouts_page(
+    db: sqlite3.Connection, user_id: int, cursor: tuple[str, int] | None = None, limit: int = PROGRESS_PAGE_SIZE
+) -> tuple[list[dict], str | None]:
+    """
+    Una pagina de sesiones con sus sets (2 consultas en total).
+    Devuelve (items, cursor_siguiente); cursor_siguiente es None al final.
+    """
+    if cursor:
+        workouts = db.execute(
+            """
+            SELECT id, date, duration_min, note
+            FROM workouts
+            WHERE user_id = ? AND (date, id) < (?, ?)
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, cursor[0], cursor[1], limit + 1),
+        ).fetchall()
+    else:
+        workouts = db.execute(
+            """
+            SELECT id, date, duration_min, note
+            FROM workouts
+            WHERE user_id = ?
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, limit + 1),
+        ).fetchall()
+
+    has_more = len(workouts) > limit
+    workouts = workouts[:limit]
+
+    sets_by_workout: dict[int, list[dict]] = {w["id"]: [] for w in workouts}
+    if workouts:
+        placeholders = ",".join("?" * len(workouts))
+        set_rows = db.execute(
+            f"""
+            SELECT s.workout_id, x.name AS exercise, s.sets, s.reps, s.weight, s.notes
+            FROM sets s
+            LEFT JOIN exercises x ON x.id = s.exercise_id
+            WHERE s.workout_id IN ({placeholders})
+            ORDER BY s.workout_id, s.id ASC
+            """,
+            [w["id"] for w in workouts],
+        ).fetchall()
+        for s in set_rows:
+            sets_by_workout[s["workout_id"]].append(
+                {
+                    "exercise": s["exercise"] or "",
+                    "sets": int(s["sets"] or 1),
+                    "reps": int(s["reps"] or 0),
+                    "weight": float(s["weight"] or 0),
+                    "notes": (s["notes"] or "").strip(),
+                }
+            )
+
+    workout_items = [
+        {
+            "date": w["date"],
+            "duration_min": int(w["duration_min"] or 0),
+            "note": (w["note"] or "").strip(),
+            "sets": sets_by_workout[w["id"]],
+        }
+        for w in workouts
+    ]
+    next_cursor = f"{workouts[-1]['date']}:{workouts[-1]['id']}" if has_more else None
+    return workout_items, next_cursor
+
+
 @app.route("/progress")
 @login_required
 def progress():
     user_id = int(session["user_id"])
     db = get_db()
 
-    workouts = db.execute(
-        """
-        SELECT id, date, duration_min, note
-        FROM workouts
-        WHERE user_id = ?
-        ORDER BY date DESC, id DESC
-        LIMIT 12
-        """,
-        (user_id,),
-    ).fetchall()
-
-    workout_items = []
-    for w in workouts:
-        set_rows = db.execute(
-            """
-            SELECT exercise, sets, reps, weight, notes
-            FROM sets
-            WHERE workout_id = ?
-            ORDER BY id ASC
-            """,
-            (w["id"],),
-        ).fetchall()
-        workout_items.append(
-            {
-                "date": w["date"],
-                "duration_min": int(w["duration_min"] or 0),
-                "note": (w["note"] or "").strip(),
-                "sets": [
-                    {
-                        "exercise": s["exercise"],
-                        "sets": int(s["sets"] or 1),
-                        "reps": int(s["reps"] or 0),
-                        "weight": float(s["weight"] or 0),
-                        "notes": (s["notes"] or "").strip(),
-                    }
-                    for s in set_rows
-                ],
-            }
-        )
+    workout_items, next_cursor = load_workouts_page(db, user_id, parse_workout_cursor(request.args.get("before")))
 
     summary_rows = db.execute(
         """
-        SELECT s.exercise as exercise,
-               MAX(w.date) as last_date,
-               MAX(s.weight) as max_weight,
-               MAX(s.weight * (1 + s.reps / 30.0)) as est_1rm,
-               SUM(s.weight * s.reps * s.sets) as volume
-        FROM sets s
-        JOIN workouts w ON w.id = s.workout_id
-        WHERE w.user_id = ?
-        GROUP BY s.exercise
-        ORDER BY last_date DESC
+        SELECT x.name AS exercise, st.last_date, st.best_weight, st.best_e1rm, st.best_e1rm_date, st.volume
+        FROM exercise_stats st
+        JOIN exercises x ON x.id = st.exercise_id
+        WHERE st.user_id = ?
+        ORDER BY st.last_date DESC
         """,
         (user_id,),
     ).fetchall()
@@ -908,17 +1536,174 @@ def progress():
             {
                 "exercise": r["exercise"],
                 "last_date": r["last_date"],
-                "max_weight": round(float(r["max_weight"] or 0), 1),
-                "est_1rm": round(float(r["est_1rm"] or 0), 1),
+                "max_weight": round(float(r["best_weight"] or 0), 1),
+                "est_1rm": round(float(r["best_e1rm"] or 0), 1),
+                "pr_date": r["best_e1rm_date"] or "",
                 "volume": round(float(r["volume"] or 0), 1),
             }
         )
 
-    db.close()
+    return render_template(
+        "progress.html",
+        workouts=workout_items,
+        summary=exercise_summary,
+        next_cursor=next_cursor,
+    )
+
+
+@app.route("/api/progress/workouts")
+@login_required
+def api_progress_workouts():
+    user_id = int(session["user_id"])
+    limit = min(max(safe_int(request.args.get("limit"), PROGRESS_PAGE_SIZE), 1), 100)
+    items, next_cursor = load_workouts_page(
+        get_db(), user_id, parse_workout_cursor(request.args.get("before")), limit
+    )
+    return jsonify({"ok": True, "workouts": items, "next": next_cursor})
+
+
+# Puntos por defecto / maximos de una serie por ejercicio.
+SERIES_POINTS = 300
+SERIES_MAX_POINTS = 2000
+
+
+def exercise_daily_series(
+    db: sqlite3.Connection, user_id: int, exercise: str, start: str, end: str
+) -> dict[str, list]:
+    """
+    Por dia: mejor peso, mejor e1RM (Epley, igual que exercise_stats) y volumen.
+    Una consulta por idx_workouts_user_date + idx_sets_workout; sale en columnas.
+    """
+    found = db.execute(
+        "SELECT id FROM exercises WHERE user_id = ? AND name_key = ?", (user_id, exercise_key(exercise))
+    ).fetchone()
+    if found is None:
+        return {"date": [], "best_weight": [], "e1rm": [], "volume": []}
+    rows = db.execute(
+        """
+        SELECT
+            w.date AS date,
+            MAX(s.weight) AS best_weight,
+            MAX(s.weight * (1 + s.reps / 30.0)) AS e1rm,
+            SUM(s.weight * s.reps * s.sets) AS volume
+        FROM workouts w
+        JOIN sets s ON s.workout_id = w.id
+        WHERE w.user_id = ? AND w.date BETWEEN ? AND ? AND s.exercise_id = ?
+        GROUP BY w.date
+        ORDER BY w.date
+        """,
+        (user_id, start, end, found[0]),
+    ).fetchall()
+    return {
+        "date": [r["date"] for r in rows],
+        "best_weight": [float(r["best_weight"] or 0) for r in rows],
+        "e1rm": [round(float(r["e1rm"] or 0), 1) for r in rows],
+        "volume": [round(float(r["volume"] or 0), 1) for r in rows],
+    }
+
+
+def downsample_series(series: dict[str, list], points: int) -> dict[str, list]:
+    """
+    LTTB sobre e1RM vs dia; los mismos indices se aplican a todas las columnas.
+    """
+    xs, valid = [], []
+    for i, d in enumerate(series["date"]):
+        try:
+            xs.append(date.fromisoformat(d).toordinal())
+        except (TypeError, ValueError):
+            continue  # Filas viejas guardadas sin validar la fecha.
+        valid.append(i)
+    if len(valid) < len(series["date"]):
+        series = {key: [values[i] for i in valid] for key, values in series.items()}
+    if len(xs) <= points:
+        return series
+    keep = lttb_indices(xs, series["e1rm"], points)
+    return {key: [values[i] for i in keep] for key, values in series.items()}
+
+
+@app.route("/api/progress/exercise")
+@login_required
+def api_exercise_series():
+    """
+    ?exercise=Nombre&from=YYYY-MM-DD&to=YYYY-MM-DD&points=N
+    """
+    user_id = int(session["user_id"])
+    exercise = (request.args.get("exercise") or "").strip()
+    if not exercise:
+        return jsonify({"ok": False, "error": "Falta el ejercicio"}), 400
+    start = parse_iso_date(request.args.get("from"), date.min)
+    end = parse_iso_date(request.args.get("to"), date.today())
+    points = min(max(safe_int(request.args.get("points"), SERIES_POINTS), 3), SERIES_MAX_POINTS)
+
+    series = exercise_daily_series(get_db(), user_id, exercise, start.isoformat(), end.isoformat())
+    total = len(series["date"])
+    return jsonify({"ok": True, "exercise": exercise, "total": total, **downsample_series(series, points)})
 
-    return render_template("progress.html", workouts=workout_items, summary=exercise_summary)
 
 
+GLOBAL_EXERCISE_INDEX = PrefixIndex(
+    (name, 0) for name in sorted({ex for items in MUSCLE_SUGGESTIONS_BASE.values() for ex in items})
+)
+
+_exercise_index_cache: "OrderedDict[int, tuple[tuple[int, int], PrefixIndex]]" = OrderedDict()
+_exercise_index_cache_size = 0
+_exercise_index_cache_lock = threading.Lock()
+
+
+def get_user_exercise_index(db: sqlite3.Connection, user_id: int) -> PrefixIndex:
+    """
+    Indice de prefijos de los ejercicios del usuario con sus usos (sesiones).
+    Se cachea por las versiones de sus ejercicios y de sus sets: notas o cambios
+    de rutina sin ejercicios nuevos no lo invalidan. LRU acotada por
+    SUGGEST_CACHE_EXERCISES.
+    """
+    global _exercise_index_cache_size
+    version = (
+        get_cache_version(db, exercises_version_key(user_id)),
+        get_cache_version(db, exercise_usage_version_key(user_id)),
+    )
+    with _exercise_index_cache_lock:
+        hit = _exercise_index_cache.get(user_id)
+        if hit and hit[0] == version:
+            _exercise_index_cache.move_to_end(user_id)
+            return hit[1]
+
+    rows = db.execute(
+        """
+        SELECT x.name, COUNT(DISTINCT s.workout_id)
+        FROM exercises x
+        LEFT JOIN sets s ON s.exercise_id = x.id
+        WHERE x.user_id = ?
+        GROUP BY x.id
+        """,
+        (user_id,),
+    ).fetchall()
+    index = PrefixIndex((r[0], r[1]) for r in rows)
+
+    with _exercise_index_cache_lock:
+        old = _exercise_index_cache.pop(user_id, None)
+        if old:
+            _exercise_index_cache_size -= len(old[1])
+        _exercise_index_cache[user_id] = (version, index)
+        _exercise_index_cache_size += len(index)
+        while _exercise_index_cache_size > SUGGEST_CACHE_EXERCISES and len(_exercise_index_cache) > 1:
+            _, (_, evicted) = _exercise_index_cache.popitem(last=False)
+            _exercise_index_cache_size -= len(evicted)
+    return index
+
+
+@app.route("/api/exercises/suggest")
+@login_required
+def api_exercise_suggest():
+    """
+    ?q=texto&limit=N -> primero los ejercicios del usuario (por uso), despues los base.
+    """
+    user_id = int(session["user_id"])
+    query = (request.args.get("q") or "")[:100]
+    limit = min(max(safe_int(request.args.get("limit"), SUGGEST_LIMIT), 1), SUGGEST_MAX_LIMIT)
+    index = get_user_exercise_index(get_db(), user_id)
+    return jsonify({"ok": True, "q": query, "items": suggest((index, GLOBAL_EXERCISE_INDEX), query, limit)})
+
 
 @app.route("/muscle-map")
 @login_required
@@ -926,21 +1711,18 @@ def muscle_map():
     return render_template("muscle_map.html", muscles=MUSCLES)
 
 
-def get_muscle_info(slug: str) -> dict:
-    db = get_db()
+def get_muscle_info(db: sqlite3.Connection, slug: str) -> dict:
     row = db.execute(
         "SELECT muscle_slug, name, overview_html FROM muscle_info WHERE muscle_slug = ?",
         (slug,),
     ).fetchone()
-    db.close()
     if not row:
         return {"slug": slug, "name": slug.title(), "overview_html": ""}
     return {"slug": row["muscle_slug"], "name": row["name"], "overview_html": row["overview_html"] or ""}
 
 
-def get_muscle_tiers(slug: str) -> list[dict]:
+def get_muscle_tiers(db: sqlite3.Connection, slug: str) -> list[dict]:
     tier_order = ["S", "A", "B", "C", "D", "E", "F"]
-    db = get_db()
     rows = db.execute(
         """
         SELECT tier, title, body_html, video_url
@@ -949,7 +1731,6 @@ def get_muscle_tiers(slug: str) -> list[dict]:
         """,
         (slug,),
     ).fetchall()
-    db.close()
     by_tier = {r["tier"]: r for r in rows}
     tiers = []
     for t in tier_order:
@@ -965,12 +1746,37 @@ def get_muscle_tiers(slug: str) -> list[dict]:
     return tiers
 
 
+# slug -> (version, json, etag). Solo musculos conocidos, asi el tamano es fijo.
+_muscle_cache: dict[str, tuple[int, bytes, str]] = {}
+MUSCLE_SLUGS = {m["slug"] for m in MUSCLES}
+
+
+def get_muscle_payload(db: sqlite3.Connection, slug: str) -> tuple[bytes, str]:
+    """
+    JSON de /api/muscles/<slug> y su ETag. Se cachea por proceso y se
+    invalida cuando cambia cache_versions["muscles"] (admin_save_muscle).
+    """
+    version = get_cache_version(db, "muscles")
+    cached = _muscle_cache.get(slug)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    payload = {"ok": True, "info": get_muscle_info(db, slug), "tiers": get_muscle_tiers(db, slug)}
+    body = json.dumps(payload, sort_keys=True).encode("utf-8")
+    etag = hashlib.sha1(body).hexdigest()
+    if slug in MUSCLE_SLUGS:
+        _muscle_cache[slug] = (version, body, etag)
+    return body, etag
+
+
 @app.route("/api/muscles/<slug>")
 @login_required
 def api_muscle(slug: str):
-    info = get_muscle_info(slug)
-    tiers = get_muscle_tiers(slug)
-    return jsonify({"ok": True, "info": info, "tiers": tiers})
+    body, etag = get_muscle_payload(get_db(), slug)
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
 
 
 @app.route("/admin/muscle-map")
@@ -1020,8 +1826,9 @@ def admin_save_muscle(slug: str):
             (slug, tier, title, body_html, video_url, datetime.utcnow().isoformat()),
         )
 
+    bump_cache_version(db, "muscles")
     db.commit()
-    db.close()
+    _muscle_cache.clear()
     return jsonify({"ok": True})
 
 
@@ -1042,6 +1849,7 @@ def admin_admins():
                     (user["id"], datetime.utcnow().isoformat()),
                 )
                 db.commit()
+                invalidate_admin_cache(user["id"])
                 flash("Admin agregado.")
             elif action == "remove":
                 if username in ADMIN_BOOTSTRAP_USERNAMES:
@@ -1049,8 +1857,16 @@ def admin_admins():
                 else:
                     db.execute("DELETE FROM admins WHERE user_id = ?", (user["id"],))
                     db.commit()
+                    invalidate_admin_cache(user["id"])
                     flash("Admin eliminado.")
-        db.close()
+            elif action == "purge":
+                if username in ADMIN_BOOTSTRAP_USERNAMES or user["id"] == int(session["user_id"]):
+                    flash("No puedes eliminar esta cuenta.")
+                else:
+                    job_id = enqueue(db, "purge_user", {"user_id": user["id"]}, dedup_key=f"purge_user:{user['id']}")
+                    db.commit()
+                    job_runner.wake()
+                    flash(f"Eliminacion de la cuenta en cola (trabajo #{job_id}).")
         return redirect(url_for("admin_admins"))
 
     db = get_db()
@@ -1062,12 +1878,64 @@ def admin_admins():
         ORDER BY u.username ASC
         """
     ).fetchall()
-    db.close()
     admins = [r["username"] for r in rows]
     return render_template("admin_admins.html", admins=admins)
 
 
 
+@app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    return render_template(
+        "admin_metrics.html",
+        routes=request_metrics.snapshot(),
+        sample_rate=METRICS_SAMPLE_RATE,
+        slow_queries=slow_queries.worst(),
+        slow_query_ms=SLOW_QUERY_MS,
+        passwords=password_pool.snapshot(),
+        pid=os.getpid(),
+    )
+
+
+@app.route("/metrics")
+def metrics_prometheus():
+    """
+    Texto Prometheus (por worker). Acceso: Bearer METRICS_TOKEN o sesion admin.
+    """
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(METRICS_TOKEN) and auth == f"Bearer {METRICS_TOKEN}"
+    if not token_ok and not current_user_is_admin(fresh=True):
+        return "Forbidden\n", 403, {"Content-Type": "text/plain"}
+    body = request_metrics.render_prometheus() + password_pool.render_prometheus()
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+@app.route("/admin/jobs", methods=["GET", "POST"])
+@admin_required
+def admin_jobs():
+    """
+    GET: conteo por estado y ultimos trabajos. POST {"kind", "user_id"?}: encola.
+    """
+    db = get_db()
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        kind = data.get("kind")
+        if kind not in ADMIN_JOB_KINDS:
+            return jsonify({"ok": False, "error": "Trabajo no soportado"}), 400
+        payload = {}
+        if kind == "rebuild_user_stats":
+            user_id = safe_int(data.get("user_id"), 0)
+            if not user_id:
+                return jsonify({"ok": False, "error": "Falta user_id"}), 400
+            payload = {"user_id": user_id}
+        dedup_key = ":".join([kind, *map(str, payload.values())])
+        job_id = enqueue(db, kind, payload, dedup_key=dedup_key)
+        db.commit()
+        job_runner.wake()
+        return jsonify({"ok": True, "id": job_id})
+    return jsonify({"ok": True, "threads": JOB_THREADS, "pid": os.getpid(), **job_summary(db)})
+
+
 @app.route("/api/save_note", methods=["POST"])
 @login_required
 def api_save_note():
@@ -1081,12 +1949,137 @@ def api_save_note():
         "INSERT INTO saved_notes (user_id, text, created_at) VALUES (?, ?, ?)",
         (user_id, text, datetime.utcnow().isoformat()),
     )
+    bump_user_data_version(db, user_id)
     db.commit()
-    db.close()
     return jsonify({"ok": True})
 
 
 
+# Filas por fetchmany en la exportacion (memoria constante).
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["workout", "date", "routine", "duration_min", "note", "exercise", "sets", "reps", "weight", "notes"]
+
+
+def iter_history_batches(user_id: int, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Historial completo (workouts x sets) en lotes de batch_size filas.
+    Usa su propia conexion del pool: el generador vive mas que el request.
+    """
+    db = _acquire_db()
+    try:
+        cur = db.execute(
+            """
+            SELECT w.id, w.date, w.routine, w.duration_min, w.note,
+                   x.name, s.sets, s.reps, s.weight, s.notes
+            FROM workouts w
+            JOIN sets s ON s.workout_id = w.id
+            LEFT JOIN exercises x ON x.id = s.exercise_id
+            WHERE w.user_id = ?
+            ORDER BY w.date ASC, w.id ASC, s.id ASC
+            """,
+            (user_id,),
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [tuple(r) for r in rows]
+    finally:
+        _release_db(db)
+
+
+def encode_history(batches, fmt: str):
+    """
+    Lotes de filas -> trozos de texto CSV o NDJSON (mismas columnas que /api/import).
+    """
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    else:
+        for rows in batches:
+            yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route("/export/<fmt>")
+@login_required
+def export_history(fmt: str):
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"ok": False, "error": "Formato no soportado"}), 404
+    user_id = int(session["user_id"])
+    filename = f"musclegain-{iso_today()}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+    chunks = encode_history(iter_history_batches(user_id), fmt)
+    if request.args.get("gzip") == "1":
+        body = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    else:
+        body = (c.encode("utf-8") for c in chunks)
+
+    return app.response_class(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def schedule_import_stats(db: sqlite3.Connection, user_id: int) -> int:
+    """
+    Tras importar: invalida caches y recalcula los resumenes fuera del request.
+    """
+    job_id = enqueue(db, "rebuild_user_stats", {"user_id": user_id}, dedup_key=f"rebuild_user_stats:{user_id}")
+    bump_user_data_version(db, user_id)
+    db.commit()
+    job_runner.wake()
+    return job_id
+
+
+@app.route("/api/import", methods=["POST"])
+@login_required
+def api_import():
+    user_id = int(session["user_id"])
+    upload = request.files.get("file")
+    if not upload:
+        return jsonify({"ok": False, "error": "Falta el archivo"}), 400
+    fmt = (request.form.get("format") or "").strip().lower() or detect_format(upload.filename or "")
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"ok": False, "error": "Formato no soportado"}), 400
+
+    db = get_db()
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    # Lo ya confirmado (on_progress llega tras cada transaccion).
+    written = {"workouts": 0}
+    try:
+        counts = import_workouts(db, user_id, stream, fmt, on_progress=written.update, rebuild_stats=False)
+    except (ValueError, csv.Error) as exc:
+        # Los lotes ya escritos cuentan aunque el archivo falle a mitad.
+        if written["workouts"]:
+            schedule_import_stats(db, user_id)
+        return jsonify({"ok": False, "error": f"Archivo invalido: {exc}"}), 400
+    else:
+        job_id = schedule_import_stats(db, user_id) if counts["workouts"] else None
+        return jsonify({"ok": True, **counts, "stats_job": job_id})
+
+
+
 @app.route("/logout")
 def logout():
     session.clear()
@@ -0,0 +1,61 @@
+# benchmarks/compare.py
+"""
+Compara dos resultados de benchmarks.routes.
+
+Uso:
+    python -m benchmarks.compare base.json nuevo.json [--threshold 10] [--fail]
+
+Marca como regresion una ruta cuyo p95 sube mas de --threshold % o que
+hace mas consultas por request. Con --fail sale con codigo 1 si hay alguna.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "queries_per_req", "rps"]
+
+
+def pct(base: float, new: float) -> float:
+    return (new - base) / base * 100 if base else 0.0
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    regressions = []
+    print(f"{'ruta':<14} {'metrica':<16} {'base':>9} {'nuevo':>9} {'cambio':>8}")
+    for name, b in base["routes"].items():
+        n = new["routes"].get(name)
+        if not n:
+            continue
+        for metric in METRICS:
+            print(f"{name:<14} {metric:<16} {b[metric]:>9.2f} {n[metric]:>9.2f} {pct(b[metric], n[metric]):>+7.1f}%")
+        if pct(b["p95_ms"], n["p95_ms"]) > threshold:
+            regressions.append(f"{name}: p95 {b['p95_ms']:.2f} -> {n['p95_ms']:.2f} ms")
+        if n["queries_per_req"] > b["queries_per_req"] + 0.01:
+            regressions.append(f"{name}: sql/req {b['queries_per_req']:.1f} -> {n['queries_per_req']:.1f}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Tolerancia de p95 en %%.")
+    parser.add_argument("--fail", action="store_true", help="Codigo de salida 1 si hay regresiones.")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print("\nRegresiones:")
+        for line in regressions:
+            print(f"  - {line}")
+    if regressions and args.fail:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# benchmarks/routes.py
+"""
+Mide las rutas calientes con el test client de Flask sobre una base sintetica.
+
+Uso:
+    python -m benchmarks.routes --users 20 --workouts 300 --sets 12 --years 3 \
+        --requests 200 --out run.json
+    python -m benchmarks.compare base.json run.json
+
+Reporta por ruta: p50/p95/p99 (ms), consultas SQL por request y throughput.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks.seed import BENCH_PASSWORD, EXERCISES, bench_username, seed
+
+
+def _session_form(rng: random.Random) -> dict:
+    rows = rng.randint(4, 12)
+    return {
+        "date": (date.today() - timedelta(days=rng.randint(0, 30))).isoformat(),
+        "duration_min": str(rng.randint(30, 90)),
+        "routine": "Bench",
+        "exercise[]": [rng.choice(EXERCISES) for _ in range(rows)],
+        "sets[]": [str(rng.randint(1, 5)) for _ in range(rows)],
+        "reps[]": [str(rng.randint(3, 12)) for _ in range(rows)],
+        "weight[]": [str(rng.randint(10, 160)) for _ in range(rows)],
+        "set_note[]": ["" for _ in range(rows)],
+    }
+
+
+ROUTES = {
+    "dashboard": lambda c, rng, slugs: c.get("/dashboard"),
+    "progress": lambda c, rng, slugs: c.get("/progress"),
+    "progress_api": lambda c, rng, slugs: c.get("/api/progress/workouts"),
+    "session_post": lambda c, rng, slugs: c.post("/session/new", data=_session_form(rng)),
+    "api_muscle": lambda c, rng, slugs: c.get(f"/api/muscles/{rng.choice(slugs)}"),
+}
+
+
+def percentiles(samples: list[float]) -> dict:
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50_ms": q[49], "p95_ms": q[94], "p99_ms": q[98]}
+
+
+def run(args: argparse.Namespace) -> dict:
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="musclegain-bench-"), "bench.db")
+    if not os.path.exists(db_path):
+        seed(db_path, args.users, args.workouts, args.sets, args.years, args.seed)
+    os.environ["DATABASE_PATH"] = db_path
+    # Sin hilos de trabajos: su polling (claim) se colaria en queries_per_req.
+    os.environ["JOB_THREADS"] = "0"
+
+    import app as musclegain  # DATABASE_PATH y JOB_THREADS deben fijarse antes de importar
+
+    queries = {"n": 0}
+    real_connect = musclegain._connect
+    bench_thread = threading.get_ident()
+
+    def count(_sql) -> None:
+        # Solo las consultas del request medido, no las de otros hilos.
+        if threading.get_ident() == bench_thread:
+            queries["n"] += 1
+
+    def counting_connect():
+        conn = real_connect()
+        conn.set_trace_callback(count)
+        return conn
+
+    musclegain._connect = counting_connect
+
+    rng = random.Random(args.seed)
+    slugs = [m["slug"] for m in musclegain.MUSCLES]
+    clients = []
+    for u in range(args.users):
+        client = musclegain.app.test_client()
+        client.post("/login", data={"username": bench_username(u), "password": BENCH_PASSWORD})
+        clients.append(client)
+
+    results = {}
+    selected = args.routes or list(ROUTES)
+    for name in selected:
+        fn = ROUTES[name]
+        for _ in range(args.warmup):
+            fn(rng.choice(clients), rng, slugs)
+
+        samples, query_counts, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            client = rng.choice(clients)
+            before = queries["n"]
+            t0 = time.perf_counter()
+            resp = fn(client, rng, slugs)
+            samples.append((time.perf_counter() - t0) * 1000)
+            query_counts.append(queries["n"] - before)
+            if resp.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+        results[name] = {
+            "n": len(samples),
+            "errors": errors,
+            "mean_ms": statistics.fmean(samples),
+            **percentiles(samples),
+            "queries_per_req": statistics.fmean(query_counts),
+            "rps": len(samples) / elapsed if elapsed else 0.0,
+        }
+
+    return {
+        "meta": {
+            "users": args.users,
+            "workouts": args.workouts,
+            "sets": args.sets,
+            "years": args.years,
+            "requests": args.requests,
+            "seed": args.seed,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "routes": results,
+    }
+
+
+def print_table(report: dict) -> None:
+    print(f"{'ruta':<14} {'p50':>8} {'p95':>8} {'p99':>8} {'sql/req':>8} {'req/s':>8} {'err':>4}")
+    for name, r in report["routes"].items():
+        print(
+            f"{name:<14} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+            f"{r['queries_per_req']:>8.1f} {r['rps']:>8.1f} {r['errors']:>4}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Base existente (si no existe se genera ahi).")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--workouts", type=int, default=200, help="Sesiones por usuario.")
+    parser.add_argument("--sets", type=int, default=10, help="Sets por sesion.")
+    parser.add_argument("--years", type=float, default=2.0)
+    parser.add_argument("--requests", type=int, default=200, help="Requests medidos por ruta.")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--routes", nargs="+", choices=list(ROUTES))
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", help="Guarda el resultado en JSON (para benchmarks.compare).")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_table(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
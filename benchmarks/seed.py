@@ -0,0 +1,102 @@
+# benchmarks/seed.py
+"""
+Genera una base SQLite sintetica para benchmarks (via init_db).
+
+Uso:
+    python -m benchmarks.seed /tmp/bench.db --users 50 --workouts 300 --sets 12 --years 3
+"""
+import argparse
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from init_db import ensure_exercise_ids, exercise_key, init_db, rebuild_daily_stats, rebuild_exercise_stats
+
+BENCH_PASSWORD = "bench"
+EXERCISES = [
+    "Press banca", "Press inclinado", "Fondos", "Aperturas", "Dominadas", "Remo con barra",
+    "Jalon al pecho", "Press militar", "Elevaciones laterales", "Face pull", "Curl barra",
+    "Curl martillo", "Extensiones polea", "Sentadilla", "Prensa", "Peso muerto rumano",
+    "Curl femoral", "Zancadas", "Hip thrust", "Plancha", "Elevaciones de talones",
+]
+
+
+def bench_username(i: int) -> str:
+    return f"bench{i:04d}"
+
+
+def seed(
+    db_path: str,
+    users: int = 20,
+    workouts_per_user: int = 200,
+    sets_per_workout: int = 10,
+    years: float = 2.0,
+    rng_seed: int = 1234,
+) -> None:
+    """
+    Crea `users` usuarios con su historial repartido en los ultimos `years` anos.
+    Todos usan la contrasena BENCH_PASSWORD.
+    """
+    init_db(db_path)
+    rng = random.Random(rng_seed)
+    today = date.today()
+    span_days = max(1, int(years * 365))
+    password = generate_password_hash(BENCH_PASSWORD)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for u in range(users):
+            name = bench_username(u)
+            cur = conn.execute(
+                "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+                (name, f"{name}@bench.local", password),
+            )
+            user_id = cur.lastrowid
+            conn.execute(
+                "INSERT INTO user_settings (user_id, rest_days, weekly_min_sessions) VALUES (?, '0', 3)",
+                (user_id,),
+            )
+            by_key = ensure_exercise_ids(conn, user_id, EXERCISES)
+            exercise_ids = [by_key[exercise_key(ex)] for ex in EXERCISES]
+
+            days = sorted(rng.sample(range(span_days), min(workouts_per_user, span_days)))
+            for offset in days:
+                cur = conn.execute(
+                    "INSERT INTO workouts (user_id, date, routine, duration_min, note) VALUES (?, ?, 'Bench', ?, '')",
+                    (user_id, (today - timedelta(days=span_days - 1 - offset)).isoformat(), rng.randint(30, 90)),
+                )
+                workout_id = cur.lastrowid
+                conn.executemany(
+                    "INSERT INTO sets (workout_id, exercise_id, sets, reps, weight, notes) VALUES (?, ?, ?, ?, ?, '')",
+                    [
+                        (workout_id, rng.choice(exercise_ids), rng.randint(1, 5), rng.randint(3, 12), rng.randint(10, 160))
+                        for _ in range(sets_per_workout)
+                    ],
+                )
+
+            conn.commit()
+
+        rebuild_daily_stats(conn)
+        rebuild_exercise_stats(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--workouts", type=int, default=200, help="Sesiones por usuario.")
+    parser.add_argument("--sets", type=int, default=10, help="Sets por sesion.")
+    parser.add_argument("--years", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+    seed(args.db_path, args.users, args.workouts, args.sets, args.years, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/streak.py
+"""
+Compara smart_streak (una consulta) con el bucle anterior (un SELECT por dia).
+
+Uso:
+    python -m benchmarks.streak --lengths 30 365 1000 3000 --repeat 20
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+_tmpdir = tempfile.mkdtemp(prefix="musclegain-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir, "bench.db")
+
+import app as musclegain  # noqa: E402  (DATABASE_PATH debe fijarse antes)
+
+
+def legacy_streak(db: sqlite3.Connection, user_id: int, rest_days: set[int], today: date) -> int:
+    """
+    Implementacion previa: un SELECT por cada dia recorrido hacia atras.
+    """
+    streak = 0
+    day = today
+    while True:
+        trained = (
+            db.execute(
+                "SELECT 1 FROM workouts WHERE user_id = ? AND date = ? LIMIT 1",
+                (user_id, day.isoformat()),
+            ).fetchone()
+            is not None
+        )
+        if trained or musclegain.today_dow_sun0(day) in rest_days:
+            streak += 1
+            day = day - timedelta(days=1)
+            continue
+        return streak
+
+
+def seed_user(db: sqlite3.Connection, username: str, days: int, today: date) -> int:
+    cur = db.execute(
+        "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+        (username, f"{username}@bench.local", "x"),
+    )
+    user_id = cur.lastrowid
+    db.executemany(
+        "INSERT INTO workouts (user_id, date, routine, duration_min, note) VALUES (?, ?, 'Bench', 45, '')",
+        [(user_id, (today - timedelta(days=i)).isoformat()) for i in range(days)],
+    )
+    musclegain.rebuild_daily_stats(db, user_id)
+    db.commit()
+    return user_id
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[30, 365, 1000, 3000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    today = date.today()
+    rest_days: set[int] = set()
+
+    with musclegain.app.app_context():
+        db = musclegain.get_db()
+        print(f"{'dias':>6} {'bucle (ms)':>12} {'consulta (ms)':>14} {'x':>7}")
+        for n in args.lengths:
+            user_id = seed_user(db, f"bench_{n}", n, today)
+            expected = legacy_streak(db, user_id, rest_days, today)
+            got = musclegain.smart_streak(db, user_id, rest_days, today)
+            assert got == min(expected, musclegain.STREAK_MAX_DAYS), (n, expected, got)
+
+            old_ms = timed(lambda: legacy_streak(db, user_id, rest_days, today), args.repeat)
+            new_ms = timed(lambda: musclegain.smart_streak(db, user_id, rest_days, today), args.repeat)
+            print(f"{n:>6} {old_ms:>12.2f} {new_ms:>14.2f} {old_ms / new_ms:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# importer.py
+"""
+Importacion masiva de entrenamientos desde CSV, JSON o NDJSON.
+
+Formato (un registro por set; campos de sesion repetidos en cada fila):
+    date, routine, duration_min, note, exercise, sets, reps, weight, notes
+Opcional: "workout" (id externo) para agrupar sets de la misma sesion.
+En JSON/NDJSON tambien se acepta un objeto por sesion con "sets": [...].
+
+Se lee en streaming (nunca el archivo entero en memoria) y se escribe en
+transacciones cortas de ~chunk_sets sets, asi otros usuarios pueden
+guardar mientras dura la importacion. Las filas consecutivas con la misma
+sesion forman un workout.
+"""
+import csv
+import json
+import sqlite3
+from datetime import date
+from typing import Callable, Iterable, Iterator, TextIO
+
+from init_db import (
+    bump_cache_version,
+    ensure_exercise_ids,
+    exercise_key,
+    exercise_usage_version_key,
+    rebuild_daily_stats,
+    rebuild_exercise_stats,
+)
+
+IMPORT_FORMATS = ("csv", "json", "ndjson")
+CHUNK_SETS = 5000
+
+_JSON_SKIP = " \t\r\n,"
+
+
+def detect_format(filename: str) -> str | None:
+    ext = (filename or "").rsplit(".", 1)[-1].lower()
+    if ext == "jsonl":
+        return "ndjson"
+    return ext if ext in IMPORT_FORMATS else None
+
+
+def _iter_csv(stream: TextIO) -> Iterator[dict]:
+    yield from csv.DictReader(stream)
+
+
+def _iter_ndjson(stream: TextIO) -> Iterator[dict]:
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise ValueError(f"Linea {lineno}: se esperaba un objeto JSON.")
+        yield obj
+
+
+def _iter_json_array(stream: TextIO, read_size: int = 1 << 16) -> Iterator[dict]:
+    """
+    Recorre un array JSON de objetos leyendo de a read_size caracteres.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof, started = "", 0, False, False
+
+    while True:
+        while pos < len(buf) and buf[pos] in _JSON_SKIP:
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                break
+            buf, pos = stream.read(read_size), 0
+            eof = not buf
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Se esperaba un array JSON.")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            break
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        if not isinstance(obj, dict):
+            raise ValueError("Cada elemento del array debe ser un objeto.")
+        yield obj
+        pos = end
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        return _iter_csv(stream)
+    if fmt == "ndjson":
+        return _iter_ndjson(stream)
+    if fmt == "json":
+        return _iter_json_array(stream)
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def _to_int(value, default: int) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(value, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _clean_date(value) -> str | None:
+    text = str(value or "").strip()[:10]
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        return None
+
+
+def _workout_fields(rec: dict) -> dict:
+    return {
+        "date": _clean_date(rec.get("date")),
+        "routine": str(rec.get("routine") or "Importado").strip(),
+        "duration_min": _to_int(rec.get("duration_min"), 0),
+        "note": str(rec.get("note") or "").strip(),
+    }
+
+
+def _set_fields(rec: dict) -> tuple[str, int, int, float, str] | None:
+    name = str(rec.get("exercise") or "").strip()
+    if not name:
+        return None
+    return (
+        name,
+        max(1, _to_int(rec.get("sets"), 1)),
+        _to_int(rec.get("reps"), 0),
+        _to_float(rec.get("weight"), 0.0),
+        str(rec.get("notes") or "").strip(),
+    )
+
+
+def iter_workouts(records: Iterable[dict], counts: dict) -> Iterator[dict]:
+    """
+    Agrupa registros en sesiones {"date", "routine", "duration_min", "note", "sets"}.
+    Suma en counts["skipped"] los registros sin fecha valida o sin ejercicio.
+    """
+    current, current_key = None, None
+    for rec in records:
+        nested = rec.get("sets")
+        if isinstance(nested, list):
+            if current:
+                yield current
+                current, current_key = None, None
+            workout = _workout_fields(rec)
+            workout["sets"] = [s for s in (_set_fields(x) for x in nested if isinstance(x, dict)) if s]
+            if workout["date"] and workout["sets"]:
+                yield workout
+            else:
+                counts["skipped"] += 1
+            continue
+
+        workout = _workout_fields(rec)
+        row = _set_fields(rec)
+        if not workout["date"] or not row:
+            counts["skipped"] += 1
+            continue
+
+        key = rec.get("workout") or rec.get("workout_id") or tuple(workout.values())
+        if key != current_key:
+            if current:
+                yield current
+            current, current_key = {**workout, "sets": []}, key
+        current["sets"].append(row)
+
+    if current:
+        yield current
+
+
+def _write_chunk(db: sqlite3.Connection, user_id: int, workouts: list[dict]) -> None:
+    """
+    Una transaccion corta: workouts (uno a uno, por su id), ejercicios y sets
+    con executemany.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [
+            db.execute(
+                "INSERT INTO workouts (user_id, date, routine, duration_min, note) VALUES (?, ?, ?, ?, ?) RETURNING id",
+                (user_id, w["date"], w["routine"], w["duration_min"], w["note"]),
+            ).fetchone()[0]
+            for w in workouts
+        ]
+
+        exercise_ids = ensure_exercise_ids(db, user_id, {s[0] for w in workouts for s in w["sets"]})
+        db.executemany(
+            "INSERT INTO sets (workout_id, exercise_id, sets, reps, weight, notes) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (wid, exercise_ids[exercise_key(s[0])], *s[1:])
+                for wid, w in zip(ids, workouts)
+                for s in w["sets"]
+            ],
+        )
+        bump_cache_version(db, exercise_usage_version_key(user_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def rebuild_user_stats(db: sqlite3.Connection, user_id: int) -> None:
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_daily_stats(db, user_id)
+        rebuild_exercise_stats(db, user_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def import_workouts(
+    db: sqlite3.Connection,
+    user_id: int,
+    stream: TextIO,
+    fmt: str,
+    chunk_sets: int = CHUNK_SETS,
+    on_progress: Callable[[dict], None] | None = None,
+    rebuild_stats: bool = True,
+) -> dict:
+    """
+    Importa todo el stream para user_id y recalcula sus resumenes al final
+    (rebuild_stats=False deja eso al llamador, p. ej. un trabajo en cola).
+    Devuelve {"workouts", "sets", "skipped"}; on_progress recibe lo mismo
+    tras cada transaccion.
+    """
+    counts = {"workouts": 0, "sets": 0, "skipped": 0}
+    pending: list[dict] = []
+    pending_sets = 0
+
+    try:
+        for workout in iter_workouts(iter_records(stream, fmt), counts):
+            pending.append(workout)
+            pending_sets += len(workout["sets"])
+            if pending_sets < chunk_sets:
+                continue
+            _write_chunk(db, user_id, pending)
+            counts["workouts"] += len(pending)
+            counts["sets"] += pending_sets
+            pending, pending_sets = [], 0
+            if on_progress:
+                on_progress(dict(counts))
+
+        if pending:
+            _write_chunk(db, user_id, pending)
+            counts["workouts"] += len(pending)
+            counts["sets"] += pending_sets
+            if on_progress:
+                on_progress(dict(counts))
+    finally:
+        # Aunque falle a mitad, los lotes ya escritos quedan con resumenes al dia.
+        if counts["workouts"] and rebuild_stats:
+            rebuild_user_stats(db, user_id)
+
+    return counts
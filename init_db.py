@@ -1,4 +1,5 @@
 ﻿# init_db.py
+import re
 import sqlite3
 
 DATABASE = "database.db"
@@ -9,14 +10,152 @@ def _column_exists(cur: sqlite3.Cursor, table: str, column: str) -> bool:
     return any(row[1] == column for row in cur.fetchall())
 
 
-def init_db(db_path: str = DATABASE) -> None:
+def clean_exercise_name(name) -> str:
+    return " ".join(str(name or "").split())
+
+
+def exercise_key(name) -> str:
+    """
+    Clave canonica de un ejercicio: sin distinguir mayusculas ni espacios.
+    """
+    return clean_exercise_name(name).casefold()
+
+
+def bump_cache_version(conn: sqlite3.Connection, key: str) -> None:
+    """
+    Invalida las caches de `key` en todos los workers (sin commit).
+    """
+    conn.execute(
+        """
+        INSERT INTO cache_versions (key, version) VALUES (?, 1)
+        ON CONFLICT(key) DO UPDATE SET version = version + 1
+        """,
+        (key,),
+    )
+
+
+def exercises_version_key(user_id: int) -> str:
+    """
+    Clave en cache_versions del conjunto de ejercicios del usuario.
+    """
+    return f"exercises:{user_id}"
+
+
+def exercise_usage_version_key(user_id: int) -> str:
+    """
+    Clave en cache_versions de los usos por ejercicio: sube al insertar sets.
     """
-    Crea las tablas necesarias si no existen.
-    Incluye pequenas migraciones si faltan columnas.
+    return f"exercise_usage:{user_id}"
+
+
+def ensure_exercise_ids(conn: sqlite3.Connection, user_id: int, names) -> dict[str, int]:
+    """
+    Crea los ejercicios que falten (sin commit) y devuelve exercise_key -> id.
+    Una variante de un nombre existente ("press  Banca") reutiliza su id.
+    Solo si se inserto alguno sube la version de exercises_version_key().
+    """
+    wanted: dict[str, str] = {}
+    for name in names:
+        clean = clean_exercise_name(name)
+        if clean:
+            wanted.setdefault(clean.casefold(), clean)
+    if not wanted:
+        return {}
+    cur = conn.executemany(
+        "INSERT INTO exercises (user_id, name, name_key) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+        [(user_id, name, key) for key, name in wanted.items()],
+    )
+    if cur.rowcount > 0:
+        bump_cache_version(conn, exercises_version_key(user_id))
+    ids: dict[str, int] = {}
+    keys = list(wanted)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for row in conn.execute(
+            f"SELECT name_key, id FROM exercises WHERE user_id = ? AND name_key IN ({placeholders})",
+            [user_id, *chunk],
+        ):
+            ids[row[0]] = row[1]
+    return ids
+
+
+def rebuild_daily_stats(conn: sqlite3.Connection, user_id: int | None = None) -> None:
+    """
+    Recalcula user_daily_stats desde workouts/sets (todo o un usuario).
+    No hace commit: el llamador decide la transaccion.
+    """
+    if user_id is None:
+        conn.execute("DELETE FROM user_daily_stats")
+        where, params = "", ()
+    else:
+        conn.execute("DELETE FROM user_daily_stats WHERE user_id = ?", (user_id,))
+        where, params = "WHERE w.user_id = ?", (user_id,)
+    conn.execute(
+        f"""
+    INSERT INTO user_daily_stats (user_id, date, sessions, volume, duration_min)
+    SELECT w.user_id, w.date, COUNT(*), COALESCE(SUM(v.vol), 0), COALESCE(SUM(w.duration_min), 0)
+    FROM workouts w
+    LEFT JOIN (
+        SELECT workout_id, SUM(weight * reps * sets) AS vol
+        FROM sets
+        GROUP BY workout_id
+    ) v ON v.workout_id = w.id
+    {where}
+    GROUP BY w.user_id, w.date
+    """,
+        params,
+    )
+
+
+def rebuild_exercise_stats(conn: sqlite3.Connection, user_id: int | None = None) -> None:
     """
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    Recalcula exercise_stats (mejor peso, mejor e1RM Epley y su fecha,
+    volumen acumulado, ultima fecha) desde workouts/sets. Sin commit.
+    """
+    # La migracion v4 la llama con el esquema previo a v8 (nombre en vez de id).
+    key = "exercise_id" if _column_exists(conn.cursor(), "exercise_stats", "exercise_id") else "exercise"
+    if user_id is None:
+        conn.execute("DELETE FROM exercise_stats")
+        where, stats_where, params = "", "", ()
+    else:
+        conn.execute("DELETE FROM exercise_stats WHERE user_id = ?", (user_id,))
+        where, stats_where, params = "WHERE w.user_id = ?", "WHERE user_id = ?", (user_id,)
+    conn.execute(
+        f"""
+    INSERT INTO exercise_stats (user_id, {key}, best_weight, best_e1rm, volume, last_date)
+    SELECT w.user_id, s.{key},
+           MAX(s.weight), MAX(s.weight * (1 + s.reps / 30.0)),
+           SUM(s.weight * s.reps * s.sets), MAX(w.date)
+    FROM sets s
+    JOIN workouts w ON w.id = s.workout_id
+    {where}
+    GROUP BY w.user_id, s.{key}
+    """,
+        params,
+    )
+    conn.execute(
+        f"""
+    UPDATE exercise_stats
+    SET best_e1rm_date = (
+        SELECT MIN(w.date)
+        FROM sets s
+        JOIN workouts w ON w.id = s.workout_id
+        WHERE w.user_id = exercise_stats.user_id
+          AND s.{key} = exercise_stats.{key}
+          AND s.weight * (1 + s.reps / 30.0) = exercise_stats.best_e1rm
+    )
+    {stats_where}
+    """,
+        params,
+    )
 
+
+def _migrate_base_schema(cur: sqlite3.Cursor) -> None:
+    """
+    v1: tablas originales. Idempotente para bases creadas antes de
+    user_version (agrega columnas que falten).
+    """
     cur.execute(
         """
     CREATE TABLE IF NOT EXISTS users (
@@ -182,5 +321,314 @@ def init_db(db_path: str = DATABASE) -> None:
     """
     )
 
-    conn.commit()
-    conn.close()
+
+def _migrate_daily_stats(cur: sqlite3.Cursor) -> None:
+    """
+    v2: resumen diario por usuario (lo mantiene register_session).
+    """
+    cur.execute(
+        """
+    CREATE TABLE IF NOT EXISTS user_daily_stats (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        sessions INTEGER DEFAULT 0,
+        volume REAL DEFAULT 0,
+        duration_min INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, date),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    ) WITHOUT ROWID
+    """
+    )
+    rebuild_daily_stats(cur.connection)
+
+
+def _migrate_indexes(cur: sqlite3.Cursor) -> None:
+    """
+    v3: indices para los accesos calientes + ANALYZE.
+    """
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts(user_id, date, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sets_workout ON sets(workout_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_routines_user ON routines(user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_routine_days_routine ON routine_days(routine_id, day_order)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_routine_exercises_day ON routine_exercises(routine_day_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_saved_notes_user ON saved_notes(user_id, id)")
+    cur.execute("ANALYZE")
+
+
+def _migrate_exercise_stats(cur: sqlite3.Cursor) -> None:
+    """
+    v4: estadisticas y PRs por ejercicio (las mantiene register_session).
+    """
+    cur.execute(
+        """
+    CREATE TABLE IF NOT EXISTS exercise_stats (
+        user_id INTEGER NOT NULL,
+        exercise TEXT NOT NULL,
+        best_weight REAL DEFAULT 0,
+        best_e1rm REAL DEFAULT 0,
+        best_e1rm_date TEXT DEFAULT '',
+        volume REAL DEFAULT 0,
+        last_date TEXT DEFAULT '',
+        PRIMARY KEY (user_id, exercise),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    ) WITHOUT ROWID
+    """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_exercise_stats_last ON exercise_stats(user_id, last_date)")
+    rebuild_exercise_stats(cur.connection)
+
+
+def _migrate_cache_versions(cur: sqlite3.Cursor) -> None:
+    """
+    v5: contadores de version para invalidar caches entre workers.
+    """
+    cur.execute(
+        """
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        key TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """
+    )
+
+
+def _migrate_jobs(cur: sqlite3.Cursor) -> None:
+    """
+    v6: cola de trabajos en segundo plano (ver jobs.py).
+    """
+    cur.execute(
+        """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        dedup_key TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after TEXT NOT NULL,
+        locked_by TEXT,
+        locked_at TEXT,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        finished_at TEXT
+    )
+    """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, run_after, id)")
+    # Un solo trabajo en cola por dedup_key (puede haber otro corriendo).
+    cur.execute(
+        """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs(dedup_key)
+    WHERE dedup_key IS NOT NULL AND status = 'queued'
+    """
+    )
+
+
+_FK_NO_ACTION = re.compile(r"(REFERENCES\s+\w+\s*\(\s*\w+\s*\))(?!\s*ON\s+DELETE)", re.IGNORECASE)
+
+
+def _rebuild_table(cur: sqlite3.Cursor, table: str, new_sql: str) -> None:
+    """
+    Recrea `table` con new_sql (su CREATE TABLE modificado): copia las filas,
+    la reemplaza y recrea sus indices y su sqlite_sequence. SQLite no permite
+    cambiar FKs ni NOT NULL con ALTER. init_db corre con foreign_keys OFF,
+    asi que el DROP no dispara nada.
+    """
+    indexes = [
+        r[0]
+        for r in cur.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,),
+        )
+    ]
+    has_seq = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'"
+    ).fetchone()
+    seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone() if has_seq else None
+    columns = ", ".join(f'"{r[1]}"' for r in cur.execute(f'PRAGMA table_info("{table}")'))
+
+    tmp = f"{table}__rebuild"
+    head = re.match(r"\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?[\"`\[]?\w+[\"`\]]?", new_sql, re.IGNORECASE)
+    cur.execute(f'CREATE TABLE "{tmp}"' + new_sql[head.end():])
+    cur.execute(f'INSERT INTO "{tmp}" ({columns}) SELECT {columns} FROM "{table}"')
+    cur.execute(f'DROP TABLE "{table}"')
+    cur.execute(f'ALTER TABLE "{tmp}" RENAME TO "{table}"')
+    for index_sql in indexes:
+        cur.execute(index_sql)
+    if seq:
+        cur.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], table))
+
+
+def _migrate_cascade_fks(cur: sqlite3.Cursor) -> None:
+    """
+    v7: todas las FOREIGN KEY pasan a ON DELETE CASCADE. Cada tabla se recrea
+    con su propio SQL, asi se conservan columnas agregadas por migraciones viejas.
+    """
+    tables = cur.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql LIKE '%REFERENCES%'"
+    ).fetchall()
+    for table, sql in tables:
+        new_sql = _FK_NO_ACTION.sub(r"\1 ON DELETE CASCADE", sql)
+        if new_sql != sql:
+            _rebuild_table(cur, table, new_sql)
+    # DROP TABLE se lleva las estadisticas de sus indices.
+    cur.execute("ANALYZE")
+
+
+def _migrate_exercise_ids(cur: sqlite3.Cursor) -> None:
+    """
+    v8: sets y routine_exercises guardan exercise_id (exercises.id) en vez
+    del nombre. Los nombres se canonizan por usuario con exercise_key; entre
+    variantes queda la de menor id. exercise_stats pasa a exercise_id.
+    exercise_id es NOT NULL con ON DELETE RESTRICT: borrar un ejercicio del
+    catalogo no puede llevarse el historial; exercise_stats (derivada) si cae.
+    """
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError("La migracion v8 necesita SQLite >= 3.35 (ALTER TABLE DROP COLUMN).")
+    conn = cur.connection
+    conn.create_function("clean_exercise_name", 1, clean_exercise_name, deterministic=True)
+    conn.create_function("exercise_key", 1, exercise_key, deterministic=True)
+
+    if not _column_exists(cur, "exercises", "name_key"):
+        cur.execute("ALTER TABLE exercises ADD COLUMN name_key TEXT")
+    # Nombres usados en sets o rutinas que nunca llegaron a exercises.
+    cur.execute(
+        """
+    INSERT OR IGNORE INTO exercises (user_id, name)
+    SELECT DISTINCT w.user_id, s.exercise FROM sets s JOIN workouts w ON w.id = s.workout_id
+    """
+    )
+    cur.execute(
+        """
+    INSERT OR IGNORE INTO exercises (user_id, name)
+    SELECT DISTINCT r.user_id, e.exercise
+    FROM routine_exercises e
+    JOIN routine_days d ON d.id = e.routine_day_id
+    JOIN routines r ON r.id = d.routine_id
+    """
+    )
+    cur.execute("UPDATE exercises SET name_key = exercise_key(name)")
+
+    # Nombre exacto guardado -> id canonico (antes de borrar las variantes).
+    cur.execute(
+        """
+    CREATE TEMP TABLE exercise_canon AS
+    SELECT e.user_id, e.name, c.id
+    FROM exercises e
+    JOIN (SELECT user_id, name_key, MIN(id) AS id FROM exercises GROUP BY user_id, name_key) c
+      ON c.user_id = e.user_id AND c.name_key = e.name_key
+    """
+    )
+    cur.execute("CREATE UNIQUE INDEX temp.idx_exercise_canon ON exercise_canon(user_id, name)")
+    cur.execute("DELETE FROM exercises WHERE id NOT IN (SELECT id FROM exercise_canon)")
+    cur.execute("UPDATE exercises SET name = clean_exercise_name(name) WHERE name <> clean_exercise_name(name)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_exercises_user_key ON exercises(user_id, name_key)")
+
+    cur.execute("ALTER TABLE sets ADD COLUMN exercise_id INTEGER")
+    cur.execute(
+        """
+    UPDATE sets SET exercise_id = (
+        SELECT c.id FROM exercise_canon c JOIN workouts w ON w.user_id = c.user_id
+        WHERE w.id = sets.workout_id AND c.name = sets.exercise
+    )
+    """
+    )
+    cur.execute("ALTER TABLE sets DROP COLUMN exercise")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sets_exercise ON sets(exercise_id)")
+
+    cur.execute("ALTER TABLE routine_exercises ADD COLUMN exercise_id INTEGER")
+    cur.execute(
+        """
+    UPDATE routine_exercises SET exercise_id = (
+        SELECT c.id
+        FROM exercise_canon c
+        JOIN routines r ON r.user_id = c.user_id
+        JOIN routine_days d ON d.routine_id = r.id
+        WHERE d.id = routine_exercises.routine_day_id AND c.name = routine_exercises.exercise
+    )
+    """
+    )
+    cur.execute("ALTER TABLE routine_exercises DROP COLUMN exercise")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_routine_exercises_exercise ON routine_exercises(exercise_id)")
+    cur.execute("DROP TABLE exercise_canon")
+
+    # Sin id solo quedan filas huerfanas (su workout o dia ya no existe): nada las muestra.
+    cur.execute("DELETE FROM sets WHERE exercise_id IS NULL")
+    cur.execute("DELETE FROM routine_exercises WHERE exercise_id IS NULL")
+    for table in ("sets", "routine_exercises"):
+        sql = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        new_sql, n = re.subn(
+            r"\bexercise_id\s+INTEGER\b",
+            "exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE RESTRICT",
+            sql,
+            flags=re.IGNORECASE,
+        )
+        if n != 1:
+            raise RuntimeError(f"v8: no se encontro exercise_id en {table}")
+        _rebuild_table(cur, table, new_sql)
+
+    cur.execute("DROP TABLE IF EXISTS exercise_stats")
+    cur.execute(
+        """
+    CREATE TABLE exercise_stats (
+        user_id INTEGER NOT NULL,
+        exercise_id INTEGER NOT NULL,
+        best_weight REAL DEFAULT 0,
+        best_e1rm REAL DEFAULT 0,
+        best_e1rm_date TEXT DEFAULT '',
+        volume REAL DEFAULT 0,
+        last_date TEXT DEFAULT '',
+        PRIMARY KEY (user_id, exercise_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (exercise_id) REFERENCES exercises(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_exercise_stats_last ON exercise_stats(user_id, last_date)")
+    rebuild_exercise_stats(conn)
+    cur.execute("ANALYZE")
+
+
+# Pasos en orden; PRAGMA user_version = cantidad de pasos aplicados.
+# Solo se agregan pasos al final, nunca se editan los ya publicados.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_daily_stats,
+    _migrate_indexes,
+    _migrate_exercise_stats,
+    _migrate_cache_versions,
+    _migrate_jobs,
+    _migrate_cascade_fks,
+    _migrate_exercise_ids,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init_db(db_path: str = DATABASE) -> None:
+    """
+    Aplica las migraciones pendientes segun PRAGMA user_version.
+    Si el esquema ya esta al dia no hace nada mas que leer la version.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        cur = conn.cursor()
+        # Las migraciones recrean tablas con FKs; dentro de la transaccion no se puede cambiar.
+        cur.execute("PRAGMA foreign_keys = OFF")
+        if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        # Varios workers pueden arrancar a la vez: el primero toma el lock
+        # de escritura y el resto vuelve a leer la version ya migrada.
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            for step, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+                migrate(cur)
+                cur.execute(f"PRAGMA user_version = {step}")
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
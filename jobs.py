@@ -0,0 +1,351 @@
+# jobs.py
+"""
+Trabajos en segundo plano sobre la tabla `jobs` (SQLite), sin servicio externo.
+
+Cada worker de gunicorn arranca su propio JobRunner con unos hilos. Reclamar
+un trabajo es un UPDATE ... RETURNING dentro de BEGIN IMMEDIATE, asi SQLite
+serializa a los workers y nadie toma el mismo trabajo dos veces. Si un worker
+muere con un trabajo "running", al vencer el lease vuelve a la cola.
+
+Los handlers reciben (db, payload); si lanzan, se reintenta con backoff
+exponencial hasta max_attempts y despues queda "failed". Mientras un handler
+corre, un hilo renueva el lease (locked_at) desde otra conexion.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Callable
+
+JOB_HANDLERS: dict[str, Callable[[sqlite3.Connection, dict], None]] = {}
+# Lease por tipo cuando no es LEASE_SECONDS (p. ej. VACUUM bloquea el heartbeat).
+JOB_LEASES: dict[str, float] = {}
+JOB_STATUSES = ("queued", "running", "done", "failed")
+# Segundos sin heartbeat tras los que un trabajo "running" se da por abandonado.
+LEASE_SECONDS = 600
+# El heartbeat renueva el lease cada lease / HEARTBEAT_DIVISOR segundos.
+HEARTBEAT_DIVISOR = 4
+RETRY_BASE_SECONDS = 5
+# Trabajos terminados que se conservan para el panel de estado.
+KEEP_FINISHED_DAYS = 7
+
+logger = logging.getLogger("musclegain.jobs")
+
+
+def job_handler(kind: str, lease_s: float | None = None):
+    def register(fn: Callable[[sqlite3.Connection, dict], None]):
+        JOB_HANDLERS[kind] = fn
+        if lease_s is not None:
+            JOB_LEASES[kind] = lease_s
+        return fn
+
+    return register
+
+
+def _now(offset_s: float = 0.0) -> str:
+    return (datetime.utcnow() + timedelta(seconds=offset_s)).isoformat(timespec="milliseconds")
+
+
+def enqueue(
+    db: sqlite3.Connection,
+    kind: str,
+    payload: dict | None = None,
+    dedup_key: str | None = None,
+    max_attempts: int = 3,
+    delay_s: float = 0.0,
+) -> int:
+    """
+    Encola (sin commit). Con dedup_key, si ya hay uno igual en cola devuelve su id.
+    """
+    now = _now()
+    cur = db.execute(
+        """
+        INSERT OR IGNORE INTO jobs (kind, payload, dedup_key, max_attempts, run_after, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (kind, json.dumps(payload or {}), dedup_key, max_attempts, _now(delay_s), now),
+    )
+    if cur.rowcount:
+        return int(cur.lastrowid)
+    row = db.execute("SELECT id FROM jobs WHERE dedup_key = ? AND status = 'queued'", (dedup_key,)).fetchone()
+    return int(row[0])
+
+
+def _expire_leases(db: sqlite3.Connection) -> None:
+    """
+    Trabajos "running" con el lease vencido (worker muerto): el intento cuenta.
+    Vuelven a la cola si les quedan intentos y no hay otro igual en cola
+    (dedup_key); si no, quedan "failed".
+    """
+    running = db.execute(
+        "SELECT id, kind, locked_at, attempts, max_attempts FROM jobs WHERE status = 'running'"
+    ).fetchall()
+    for job_id, kind, locked_at, attempts, max_attempts in running:
+        if locked_at >= _now(-JOB_LEASES.get(kind, LEASE_SECONDS)):
+            continue
+        error = f"Lease vencido en el intento {attempts}"
+        if attempts < max_attempts:
+            try:
+                db.execute(
+                    """
+                    UPDATE jobs SET status = 'queued', locked_by = NULL, locked_at = NULL, last_error = ?
+                    WHERE id = ?
+                    """,
+                    (error, job_id),
+                )
+                continue
+            except sqlite3.IntegrityError:
+                error = f"{error} (reemplazado por otro en cola)"
+        db.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, locked_by = NULL, last_error = ? WHERE id = ?",
+            (_now(), error, job_id),
+        )
+
+
+def claim(db: sqlite3.Connection, worker: str) -> tuple | None:
+    """
+    Toma el siguiente trabajo listo: (id, kind, payload, attempts, max_attempts).
+    """
+    now = _now()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        _expire_leases(db)
+        row = db.execute(
+            """
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = 'queued' AND run_after <= ?
+                ORDER BY run_after, id
+                LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+            """,
+            (worker, now, now),
+        ).fetchone()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return tuple(row) if row else None
+
+
+def _finish(db: sqlite3.Connection, job: tuple, worker: str, error: str | None) -> None:
+    """
+    Cierra el intento solo si `worker` sigue siendo el duenio: si el lease vencio
+    y otro lo tomo (o lo dio por fallido), el estado de ese otro no se pisa.
+    """
+    job_id, kind, _, attempts, max_attempts = job
+    if error is None:
+        cur = db.execute(
+            """
+            UPDATE jobs SET status = 'done', finished_at = ?, locked_by = NULL, last_error = NULL
+            WHERE id = ? AND locked_by = ?
+            """,
+            (_now(), job_id, worker),
+        )
+    elif attempts < max_attempts:
+        try:
+            cur = db.execute(
+                """
+                UPDATE jobs SET status = 'queued', run_after = ?, locked_by = NULL, last_error = ?
+                WHERE id = ? AND locked_by = ?
+                """,
+                (_now(RETRY_BASE_SECONDS * 2 ** (attempts - 1)), error, job_id, worker),
+            )
+        except sqlite3.IntegrityError:
+            # Ya hay otro igual en cola (dedup_key): ese hara el trabajo.
+            cur = db.execute(
+                """
+                UPDATE jobs SET status = 'failed', finished_at = ?, locked_by = NULL, last_error = ?
+                WHERE id = ? AND locked_by = ?
+                """,
+                (_now(), f"{error} (reemplazado por otro en cola)", job_id, worker),
+            )
+    else:
+        cur = db.execute(
+            """
+            UPDATE jobs SET status = 'failed', finished_at = ?, locked_by = NULL, last_error = ?
+            WHERE id = ? AND locked_by = ?
+            """,
+            (_now(), error, job_id, worker),
+        )
+    if not cur.rowcount:
+        logger.warning("Trabajo %s (%s): %s perdio el lease, no se actualiza su estado", job_id, kind, worker)
+    db.commit()
+
+
+class _Heartbeat:
+    """
+    Renueva locked_at mientras el handler corre, desde su propia conexion
+    (la del handler esta ocupada). Sin archivo (":memory:") no hace nada.
+    """
+
+    def __init__(self, db: sqlite3.Connection, job_id: int, worker: str, interval_s: float) -> None:
+        self.path = db.execute("PRAGMA database_list").fetchone()[2]
+        self.job_id = job_id
+        self.worker = worker
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        if self.path:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=self.interval_s)
+        try:
+            while not self._stop.wait(self.interval_s):
+                try:
+                    cur = conn.execute(
+                        "UPDATE jobs SET locked_at = ? WHERE id = ? AND locked_by = ? AND status = 'running'",
+                        (_now(), self.job_id, self.worker),
+                    )
+                    conn.commit()
+                except sqlite3.Error as exc:
+                    logger.warning("Heartbeat del trabajo %s: %s", self.job_id, exc)
+                    continue
+                if not cur.rowcount:
+                    return
+        finally:
+            conn.close()
+
+
+def run_one(db: sqlite3.Connection, worker: str) -> bool:
+    """
+    Ejecuta un trabajo si hay alguno listo. Devuelve False si la cola esta vacia.
+    """
+    job = claim(db, worker)
+    if job is None:
+        return False
+    job_id, kind, payload, attempts, _ = job
+    handler = JOB_HANDLERS.get(kind)
+    interval_s = JOB_LEASES.get(kind, LEASE_SECONDS) / HEARTBEAT_DIVISOR
+    try:
+        if handler is None:
+            raise LookupError(f"Sin handler para {kind!r}")
+        with _Heartbeat(db, job_id, worker, interval_s):
+            handler(db, json.loads(payload or "{}"))
+            db.commit()
+    except Exception as exc:
+        if db.in_transaction:
+            db.rollback()
+        logger.warning("Trabajo %s (%s) fallo en el intento %s: %s", job_id, kind, attempts, exc)
+        _finish(db, job, worker, f"{type(exc).__name__}: {exc}")
+    else:
+        _finish(db, job, worker, None)
+    return True
+
+
+def prune(db: sqlite3.Connection, keep_days: int = KEEP_FINISHED_DAYS) -> None:
+    db.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+        (_now(-keep_days * 86400),),
+    )
+    db.commit()
+
+
+def job_summary(db: sqlite3.Connection, limit: int = 50) -> dict:
+    counts = {status: 0 for status in JOB_STATUSES}
+    for status, n in db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+        counts[status] = n
+    rows = db.execute(
+        """
+        SELECT id, kind, payload, dedup_key, status, attempts, max_attempts, run_after,
+               locked_by, last_error, created_at, finished_at
+        FROM jobs
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+    keys = ("id", "kind", "payload", "dedup_key", "status", "attempts", "max_attempts", "run_after",
+            "locked_by", "last_error", "created_at", "finished_at")
+    jobs = [dict(zip(keys, r)) for r in rows]
+    for job in jobs:
+        job["payload"] = json.loads(job["payload"] or "{}")
+    return {"counts": counts, "jobs": jobs}
+
+
+class JobRunner:
+    """
+    Hilos que sacan trabajos de la tabla. acquire/release prestan conexiones
+    (el pool de la app). start() es idempotente por proceso: tras un fork los
+    hilos del padre no existen, asi que se vuelven a crear.
+    """
+
+    def __init__(
+        self,
+        acquire: Callable[[], sqlite3.Connection],
+        release: Callable[[sqlite3.Connection], None],
+        threads: int = 2,
+        poll_s: float = 1.0,
+    ) -> None:
+        self.acquire = acquire
+        self.release = release
+        self.threads = threads
+        self.poll_s = poll_s
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_prune = 0.0
+
+    def start(self) -> None:
+        if self.threads <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            for i in range(self.threads):
+                name = f"jobs-{i}"
+                threading.Thread(target=self._loop, args=(f"{socket.gethostname()}:{self._pid}:{name}",),
+                                 name=name, daemon=True).start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self, worker: str) -> None:
+        while not self._stop.is_set():
+            ran = False
+            try:
+                db = self.acquire()
+                try:
+                    ran = run_one(db, worker)
+                    if not ran:
+                        self._maybe_prune(db)
+                finally:
+                    self.release(db)
+            except sqlite3.Error as exc:
+                # Lock ocupado u otro error de la base: se reintenta en el siguiente poll.
+                logger.warning("Runner %s: %s", worker, exc)
+            except Exception:
+                # Cualquier otro error no debe matar el hilo en silencio.
+                logger.exception("Runner %s: error inesperado", worker)
+            if not ran:
+                self._wake.wait(self.poll_s)
+                self._wake.clear()
+
+    def _maybe_prune(self, db: sqlite3.Connection) -> None:
+        now = datetime.utcnow().timestamp()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        prune(db)
@@ -0,0 +1,263 @@
+# metrics.py
+"""
+Metricas por ruta en memoria (por proceso): latencia total, tiempo SQL,
+tiempo de render y consultas por request, en histogramas de buckets fijos.
+Tambien el log de consultas lentas (con EXPLAIN QUERY PLAN).
+
+Coste cuando un request no se muestrea y el log lento esta apagado: una
+lectura de threading.local por consulta. Si no: dos perf_counter().
+"""
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_local = threading.local()
+
+
+class RequestSample:
+    __slots__ = ("start", "queries", "sql_s", "render_s", "render_start")
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_s = 0.0
+        self.render_s = 0.0
+        self.render_start = 0.0
+
+
+def start_sample() -> RequestSample:
+    sample = RequestSample()
+    _local.sample = sample
+    return sample
+
+
+def current_sample() -> RequestSample | None:
+    return getattr(_local, "sample", None)
+
+
+def end_sample() -> RequestSample | None:
+    sample = getattr(_local, "sample", None)
+    _local.sample = None
+    return sample
+
+
+def set_current_route(route: str | None) -> None:
+    _local.route = route
+
+
+def _normalize_sql(sql: str) -> str:
+    sql = " ".join(sql.split())
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+
+
+def _param_shape(parameters, many: bool) -> str:
+    if many:
+        if isinstance(parameters, (list, tuple)) and parameters:
+            return f"{len(parameters)} x {_param_shape(parameters[0], False)}"
+        return "many"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if len(parameters) > 8:
+        return f"({len(parameters)} params)"
+    return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+
+
+class SlowQueryLog:
+    """
+    Agrega consultas que superan threshold_ms por SQL normalizado.
+    Guarda como mucho max_entries (descarta la de menor tiempo total).
+    """
+
+    def __init__(self, threshold_ms: float = 0.0, max_entries: int = 200) -> None:
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._logger = logging.getLogger("musclegain.sql")
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def record(self, conn: sqlite3.Connection, sql: str, parameters, elapsed_ms: float, many: bool) -> None:
+        plan = self._explain(conn, sql, parameters, many)
+        normalized = _normalize_sql(sql)
+        shape = _param_shape(parameters, many)
+        route = getattr(_local, "route", None) or "-"
+        self._logger.warning(
+            "Consulta lenta %.1f ms [%s] %s params=%s plan=%s", elapsed_ms, route, normalized, shape, " | ".join(plan)
+        )
+        with self._lock:
+            entry = self._entries.get(normalized)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    smallest = min(self._entries, key=lambda k: self._entries[k]["total_ms"])
+                    del self._entries[smallest]
+                entry = self._entries[normalized] = {"sql": normalized, "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry.update(route=route, params=shape, plan=plan, last_seen=datetime.utcnow().isoformat(timespec="seconds"))
+
+    def _explain(self, conn: sqlite3.Connection, sql: str, parameters, many: bool) -> list[str]:
+        if many:
+            if not isinstance(parameters, (list, tuple)) or not parameters:
+                return []
+            parameters = parameters[0]
+        try:
+            # Directo a sqlite3.Connection para no volver a pasar por el wrapper.
+            rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error:
+            return []
+        return [str(r[-1]) for r in rows]
+
+    def worst(self, limit: int = 20) -> list[dict]:
+        with self._lock:
+            entries = [dict(e) for e in self._entries.values()]
+        entries.sort(key=lambda e: e["total_ms"], reverse=True)
+        for e in entries:
+            e["total_ms"] = round(e["total_ms"], 1)
+            e["max_ms"] = round(e["max_ms"], 1)
+            e["mean_ms"] = round(e["total_ms"] / e["count"], 1)
+        return entries[:limit]
+
+
+slow_queries = SlowQueryLog()
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    Conexion que mide execute/executemany si el request esta muestreado o
+    el log de consultas lentas esta activo. (set_trace_callback no entrega
+    duraciones, por eso se envuelve aqui.) En un SELECT se mide hasta la
+    primera fila, que es donde SQLite resuelve scans y ordenamientos.
+    """
+
+    def _timed(self, run, sql, parameters, many: bool):
+        sample = getattr(_local, "sample", None)
+        if sample is None and not slow_queries.enabled:
+            return run(self, sql, parameters)
+        t0 = time.perf_counter()
+        try:
+            return run(self, sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - t0
+            if sample is not None:
+                sample.sql_s += elapsed
+                sample.queries += 1
+            if slow_queries.enabled and elapsed * 1000 >= slow_queries.threshold_ms:
+                slow_queries.record(self, sql, parameters, elapsed * 1000, many)
+
+    def execute(self, sql, parameters=(), /):
+        return self._timed(sqlite3.Connection.execute, sql, parameters, False)
+
+    def executemany(self, sql, parameters, /):
+        return self._timed(sqlite3.Connection.executemany, sql, parameters, True)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Aproximacion: limite superior del bucket que contiene el cuantil.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return float(bound)
+        return float("inf")
+
+
+class RouteMetrics:
+    __slots__ = ("latency_ms", "sql_ms", "render_ms", "queries")
+
+    def __init__(self) -> None:
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.sql_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.render_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._routes: dict[str, RouteMetrics] = {}
+
+    def record(self, route: str, sample: RequestSample) -> None:
+        total_ms = (time.perf_counter() - sample.start) * 1000
+        with self._lock:
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = RouteMetrics()
+            metrics.latency_ms.observe(total_ms)
+            metrics.sql_ms.observe(sample.sql_s * 1000)
+            metrics.render_ms.observe(sample.render_s * 1000)
+            metrics.queries.observe(sample.queries)
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            rows = [
+                {
+                    "route": route,
+                    "requests": m.latency_ms.count,
+                    "latency_mean_ms": round(m.latency_ms.mean(), 2),
+                    "latency_p50_ms": m.latency_ms.quantile(0.5),
+                    "latency_p95_ms": m.latency_ms.quantile(0.95),
+                    "latency_p99_ms": m.latency_ms.quantile(0.99),
+                    "sql_mean_ms": round(m.sql_ms.mean(), 2),
+                    "render_mean_ms": round(m.render_ms.mean(), 2),
+                    "queries_mean": round(m.queries.mean(), 1),
+                }
+                for route, m in self._routes.items()
+            ]
+        return sorted(rows, key=lambda r: r["latency_mean_ms"] * r["requests"], reverse=True)
+
+    def render_prometheus(self, prefix: str = "musclegain") -> str:
+        series = [
+            ("request_duration_seconds", "latency_ms", "Latencia total del request.", 1000),
+            ("request_sql_seconds", "sql_ms", "Tiempo en SQL por request.", 1000),
+            ("request_render_seconds", "render_ms", "Tiempo de render de plantillas por request.", 1000),
+            ("request_queries", "queries", "Consultas SQL por request.", 1),
+        ]
+        lines = []
+        with self._lock:
+            for name, attr, help_text, scale in series:
+                metric = f"{prefix}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for route, m in sorted(self._routes.items()):
+                    hist: Histogram = getattr(m, attr)
+                    cumulative = 0
+                    for bound, n in zip(hist.bounds, hist.counts):
+                        cumulative += n
+                        lines.append(f'{metric}_bucket{{route="{route}",le="{bound / scale:g}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{route="{route}",le="+Inf"}} {hist.count}')
+                    lines.append(f'{metric}_sum{{route="{route}"}} {hist.total / scale:.6f}')
+                    lines.append(f'{metric}_count{{route="{route}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,176 @@
+# passwords.py
+"""
+Hash y verificacion de contrasenas fuera del hilo del request.
+
+Un pool de procesos acotado (por worker) hace el trabajo de CPU; un semaforo
+limita cuantas operaciones pueden estar en vuelo o esperando. Si se llena,
+HashPoolBusy deja responder 503 en vez de encolar logins sin fin.
+Con workers=0 todo corre en linea (desarrollo, tests, workers sync de gunicorn).
+"""
+import multiprocessing
+import os
+import shlex
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import LATENCY_BUCKETS_MS, Histogram
+
+
+# forkserver: los hijos salen de un proceso servidor limpio y no del worker, que
+# ya tiene hilos (job runner, requests) cuyos locks un fork copiaria a medias.
+# Como con spawn, el hijo importa el modulo principal una vez: los scripts de
+# entrada necesitan su `if __name__ == "__main__"`.
+_MP_START = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+class HashPoolBusy(RuntimeError):
+    pass
+
+
+def default_workers(cmd_args: str | None = None) -> int:
+    """
+    1 si gunicorn corre con hilos (gthread o --threads > 1), si no 0.
+
+    Con un worker sync el hash en linea solo bloquea su propio request; el pool
+    de procesos sirve cuando otros hilos del worker esperan por el GIL.
+    """
+    if cmd_args is None:
+        cmd_args = os.getenv("GUNICORN_CMD_ARGS", "")
+    args = shlex.split(cmd_args)
+    opts = {}
+    for i, arg in enumerate(args):
+        name, sep, value = arg.partition("=")
+        opts[name] = value if sep or i + 1 == len(args) else args[i + 1]
+    if opts.get("-k", opts.get("--worker-class", "")).endswith("gthread"):
+        return 1
+    threads = opts.get("--threads", "")
+    return 1 if threads.isdigit() and int(threads) > 1 else 0
+
+
+def _run(op: str, args: tuple, submitted: float) -> tuple[object, float, float]:
+    started = time.time()
+    if op == "hash":
+        result = generate_password_hash(*args)
+    else:
+        result = check_password_hash(*args)
+    return result, started - submitted, time.time() - started
+
+
+def hash_method(pwhash: str) -> str:
+    return pwhash.split("$", 1)[0]
+
+
+class HashPool:
+    def __init__(self, method: str, workers: int = 1, max_pending: int = 16, wait_s: float = 5.0) -> None:
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_s = wait_s
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pid = None
+        self.queue_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.hash_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.rejected = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Uno por proceso: un pool heredado por fork (gunicorn --preload) no sirve.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(_MP_START)
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # Solo el primero que lo ve roto lo saca; el proximo _pool() crea otro.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._pid = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, op: str, *args):
+        if not self._slots.acquire(timeout=self.wait_s):
+            with self._lock:
+                self.rejected += 1
+            raise HashPoolBusy("Demasiadas operaciones de contrasena en curso.")
+        try:
+            submitted = time.time()
+            if self.workers <= 0:
+                result, queued, took = _run(op, args, submitted)
+            else:
+                pool = self._pool()
+                try:
+                    result, queued, took = pool.submit(_run, op, args, submitted).result()
+                except BrokenProcessPool:
+                    # Un hijo murio (OOM, kill): se cierra el pool roto, se crea otro y se reintenta una vez.
+                    self._discard(pool)
+                    pool = self._pool()
+                    try:
+                        result, queued, took = pool.submit(_run, op, args, submitted).result()
+                    except BrokenProcessPool as exc:
+                        # Si vuelve a romperse, mismo 503 que con el pool lleno y no un 500.
+                        self._discard(pool)
+                        with self._lock:
+                            self.rejected += 1
+                        raise HashPoolBusy("Pool de contrasenas no disponible.") from exc
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.queue_ms.observe(max(queued, 0.0) * 1000)
+            self.hash_ms.observe(took * 1000)
+        return result
+
+    def hash(self, password: str) -> str:
+        return self._call("hash", password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return bool(self._call("check", pwhash, password))
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        return hash_method(pwhash) != self.method
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "operations": self.hash_ms.count,
+                "rejected": self.rejected,
+                "queue_mean_ms": round(self.queue_ms.mean(), 2),
+                "queue_p95_ms": self.queue_ms.quantile(0.95),
+                "hash_mean_ms": round(self.hash_ms.mean(), 2),
+                "hash_p95_ms": self.hash_ms.quantile(0.95),
+            }
+
+    def render_prometheus(self, prefix: str = "musclegain") -> str:
+        lines = []
+        with self._lock:
+            for name, hist, help_text in (
+                ("password_queue_seconds", self.queue_ms, "Espera en cola del pool de contrasenas."),
+                ("password_hash_seconds", self.hash_ms, "Tiempo de hash/verificacion de contrasenas."),
+            ):
+                metric = f"{prefix}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip(hist.bounds, hist.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{le="{bound / 1000:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+                lines.append(f"{metric}_sum {hist.total / 1000:.6f}")
+                lines.append(f"{metric}_count {hist.count}")
+            metric = f"{prefix}_password_rejected_total"
+            lines.append(f"# HELP {metric} Operaciones rechazadas (pool lleno o roto).")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {self.rejected}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,40 @@
+# series.py
+"""
+Reduccion de series temporales para graficos.
+
+lttb_indices() implementa Largest-Triangle-Three-Buckets: conserva la forma
+visual (picos y caidas) con `threshold` puntos. Devuelve indices para poder
+aplicar la misma seleccion a varias series alineadas.
+"""
+from typing import Sequence
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> list[int]:
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    out = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Promedio del bucket siguiente (tercer vertice del triangulo).
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        span = nxt_end - nxt_start
+        avg_x = sum(xs[nxt_start:nxt_end]) / span
+        avg_y = sum(ys[nxt_start:nxt_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+
+    out.append(n - 1)
+    return out
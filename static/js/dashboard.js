@@ -84,3 +84,40 @@ function toast(msg) {
 
   render();
 })();
+
+// Refresco de KPIs al volver a la pestana (304 si nada cambio)
+(function liveStats() {
+  const root = $("dashboardStats");
+  if (!root || !root.dataset.url) return;
+
+  let etag = root.dataset.etag || null;
+
+  function apply(data) {
+    document.querySelectorAll("[data-stat]").forEach((el) => {
+      const value = data.stats?.[el.dataset.stat];
+      if (value !== undefined) el.textContent = value;
+    });
+    document.querySelectorAll("[data-focus]").forEach((el) => {
+      const value = data.focus?.[el.dataset.focus];
+      if (value !== undefined) el.textContent = value;
+    });
+  }
+
+  async function refresh() {
+    try {
+      const res = await fetch(root.dataset.url, {
+        headers: etag ? { "If-None-Match": etag } : {},
+        cache: "no-store"
+      });
+      if (res.status === 304 || !res.ok) return;
+      etag = res.headers.get("ETag");
+      apply(await res.json());
+    } catch {
+      // Sin red: se queda lo renderizado.
+    }
+  }
+
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "visible") refresh();
+  });
+})();
@@ -0,0 +1,65 @@
+// progress.js
+
+// Carga paginas anteriores del historial sin recargar (/api/progress/workouts).
+(function loadMoreWorkouts() {
+  const btn = document.getElementById("loadMoreWorkouts");
+  const list = document.getElementById("sessionList");
+  if (!btn || !list) return;
+
+  function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function renderWorkout(w) {
+    const card = el("div", "session-card");
+    const head = el("div", "session-head");
+    const info = el("div");
+    info.appendChild(el("div", "session-date", w.date));
+    info.appendChild(el("div", "session-meta", `${w.duration_min} min${w.note ? " · " + w.note : ""}`));
+    head.appendChild(info);
+    card.appendChild(head);
+
+    const sets = el("div", "set-list");
+    w.sets.forEach((s) => {
+      const item = el("div", "set-item");
+      item.appendChild(el("div", "set-exercise", s.exercise));
+      item.appendChild(el("div", "set-values", `${s.sets}x${s.reps} · ${s.weight} kg`));
+      if (s.notes) item.appendChild(el("div", "set-notes", s.notes));
+      sets.appendChild(item);
+    });
+    card.appendChild(sets);
+    return card;
+  }
+
+  btn.addEventListener("click", async (event) => {
+    event.preventDefault();
+    const next = btn.dataset.next;
+    if (!next || btn.classList.contains("loading")) return;
+
+    btn.classList.add("loading");
+    try {
+      const res = await fetch(`${btn.dataset.url}?before=${encodeURIComponent(next)}`);
+      const data = await res.json();
+      if (!data.ok) throw new Error("bad response");
+
+      data.workouts.forEach((w) => list.appendChild(renderWorkout(w)));
+      if (data.next) {
+        btn.dataset.next = data.next;
+        // El fallback del catch debe seguir desde aqui, no volver al primer cursor.
+        const href = new URL(btn.href, window.location.href);
+        href.searchParams.set("before", data.next);
+        btn.href = href.toString();
+      } else {
+        btn.parentElement.remove();
+      }
+    } catch {
+      // Sin JS o con error, el enlace sigue funcionando como paginacion normal.
+      window.location.href = btn.href;
+    } finally {
+      btn.classList.remove("loading");
+    }
+  });
+})();
@@ -108,6 +108,60 @@
   }
 })();
 
+// Exercise autocomplete: the datalist is filled from /api/exercises/suggest
+(function exerciseAutocomplete() {
+  const list = document.getElementById("exerciseList");
+  const url = list && list.dataset.suggestUrl;
+  if (!url) return;
+
+  const cache = new Map();
+  let timer = null;
+  let controller = null;
+
+  function fill(items) {
+    list.innerHTML = "";
+    items.forEach((name) => {
+      const opt = document.createElement("option");
+      opt.value = name;
+      list.appendChild(opt);
+    });
+  }
+
+  async function load(q) {
+    const key = q.toLowerCase();
+    if (cache.has(key)) {
+      fill(cache.get(key));
+      return;
+    }
+    if (controller) controller.abort();
+    controller = new AbortController();
+    try {
+      const res = await fetch(`${url}?q=${encodeURIComponent(q)}`, { signal: controller.signal });
+      if (!res.ok) return;
+      const data = await res.json();
+      cache.set(key, data.items || []);
+      fill(data.items || []);
+    } catch (e) {
+      // Aborted by a newer keystroke or offline: keep the current options.
+    }
+  }
+
+  function isExerciseInput(el) {
+    return el && el.matches && el.matches("input[name='exercise[]']");
+  }
+
+  document.addEventListener("input", (event) => {
+    if (!isExerciseInput(event.target)) return;
+    const q = event.target.value.trim();
+    clearTimeout(timer);
+    timer = setTimeout(() => load(q), 120);
+  });
+
+  document.addEventListener("focusin", (event) => {
+    if (isExerciseInput(event.target)) load(event.target.value.trim());
+  });
+})();
+
 (function routineDays() {
   const addBtn = document.getElementById("addDayBtn");
   const container = document.getElementById("dayContainer");
@@ -0,0 +1,81 @@
+# suggest.py
+"""
+Autocompletado de ejercicios con indices de prefijos en memoria.
+
+PrefixIndex guarda una entrada por cada inicio de palabra del nombre
+normalizado (exercise_key) en una lista ordenada: buscar son dos bisect y
+ordenar los candidatos por uso. Asi "banca" tambien encuentra "Press banca".
+"""
+import bisect
+import heapq
+from typing import Iterable
+
+from init_db import exercise_key
+
+# Mayor code point: cota superior de "todo lo que empieza por q".
+_PREFIX_END = "\U0010ffff"
+
+
+class PrefixIndex:
+    __slots__ = ("names", "uses", "_keys", "_ids")
+
+    def __init__(self, items: Iterable[tuple[str, int]]) -> None:
+        """
+        items: (nombre, usos). Los nombres repetidos (misma clave) se ignoran.
+        """
+        self.names: list[str] = []
+        self.uses: list[int] = []
+        seen = set()
+        entries = []
+        for name, uses in items:
+            key = exercise_key(name)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            i = len(self.names)
+            self.names.append(name)
+            self.uses.append(int(uses or 0))
+            pos = 0
+            for word in key.split(" "):
+                entries.append((key[pos:], i))
+                pos += len(word) + 1
+        entries.sort()
+        self._keys = [k for k, _ in entries]
+        self._ids = [i for _, i in entries]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, query: str, limit: int) -> list[str]:
+        """
+        Nombres con alguna palabra que empieza por query; mas usados primero.
+        Con query vacia, los mas usados.
+        """
+        q = exercise_key(query)
+        if q:
+            lo = bisect.bisect_left(self._keys, q)
+            hi = bisect.bisect_left(self._keys, q + _PREFIX_END, lo)
+            ids = set(self._ids[lo:hi])
+        else:
+            ids = range(len(self.names))
+        best = heapq.nsmallest(limit, ids, key=lambda i: (-self.uses[i], self.names[i].casefold()))
+        return [self.names[i] for i in best]
+
+
+def suggest(indexes: Iterable[PrefixIndex], query: str, limit: int) -> list[str]:
+    """
+    Junta los resultados de varios indices en orden (el del usuario primero),
+    sin repetir ejercicios.
+    """
+    out: list[str] = []
+    seen = set()
+    for index in indexes:
+        for name in index.search(query, limit):
+            key = exercise_key(name)
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append(name)
+            if len(out) >= limit:
+                return out
+    return out
@@ -0,0 +1,26 @@
+import importlib
+
+import pytest
+
+FAST_HASH = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture
+def musclegain(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "app.db"))
+    monkeypatch.setenv("JOB_THREADS", "0")
+    monkeypatch.delenv("PASSWORD_HASH_WORKERS", raising=False)
+    monkeypatch.delenv("GUNICORN_CMD_ARGS", raising=False)
+    import app
+
+    module = importlib.reload(app)
+    monkeypatch.setattr(module.password_pool, "method", FAST_HASH)
+    return module
+
+
+@pytest.fixture
+def client(musclegain):
+    """Cliente con la cuenta "ana" (contrasena "secreto") registrada, sin sesion."""
+    client = musclegain.app.test_client()
+    client.post("/register", data={"username": "ana", "email": "ana@x.com", "password": "secreto"})
+    return client
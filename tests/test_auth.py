@@ -0,0 +1,38 @@
+def count_user_lookups(musclegain, monkeypatch):
+    seen = []
+    real_connect = musclegain._connect
+
+    def traced():
+        conn = real_connect()
+        conn.set_trace_callback(lambda sql: seen.append(sql) if "FROM users WHERE id" in sql else None)
+        return conn
+
+    monkeypatch.setattr(musclegain, "_connect", traced)
+    # Conexiones ya en el pool no pasan por _connect.
+    while not musclegain._db_pool.empty():
+        musclegain._db_pool.get_nowait().close()
+    return seen
+
+
+def test_login_required_caches_account_lookup(musclegain, client, monkeypatch):
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+    seen = count_user_lookups(musclegain, monkeypatch)
+
+    assert client.get("/dashboard").status_code == 200
+    assert client.get("/dashboard").status_code == 200
+    assert len(seen) == 1
+
+
+def test_purged_account_is_logged_out(musclegain, client):
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+    assert client.get("/dashboard").status_code == 200
+
+    with musclegain.app.app_context():
+        db = musclegain.get_db()
+        user_id = db.execute("SELECT id FROM users WHERE username = 'ana'").fetchone()[0]
+        musclegain.purge_user(db, user_id)
+
+    resp = client.get("/dashboard")
+    assert resp.status_code == 302 and resp.headers["Location"].endswith("/login")
+    with client.session_transaction() as sess:
+        assert "user_id" not in sess
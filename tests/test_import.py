@@ -0,0 +1,59 @@
+import functools
+import io
+import json
+
+import importer
+
+
+def ndjson(*records, tail=""):
+    return io.BytesIO(("\n".join(json.dumps(r) for r in records) + "\n" + tail).encode())
+
+
+def workout(day, exercise, weight):
+    return {"date": f"2024-01-{day:02d}", "exercise": exercise, "sets": 3, "reps": 5, "weight": weight}
+
+
+def post(client, body):
+    return client.post("/api/import", data={"file": (body, "data.ndjson")})
+
+
+def queued_rebuilds(musclegain):
+    with musclegain.app.app_context():
+        return musclegain.get_db().execute("SELECT COUNT(*) FROM jobs WHERE kind = 'rebuild_user_stats'").fetchone()[0]
+
+
+def test_sets_land_on_their_own_workout(musclegain, client):
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+    resp = post(client, ndjson(workout(1, "Sentadilla", 100), workout(2, "Press banca", 60)))
+    assert resp.json["ok"] and resp.json["workouts"] == 2 and resp.json["stats_job"]
+
+    with musclegain.app.app_context():
+        rows = musclegain.get_db().execute(
+            """
+            SELECT w.date, e.name, s.weight
+            FROM sets s JOIN workouts w ON w.id = s.workout_id JOIN exercises e ON e.id = s.exercise_id
+            ORDER BY w.date
+            """
+        ).fetchall()
+    assert [tuple(r) for r in rows] == [("2024-01-01", "Sentadilla", 100.0), ("2024-01-02", "Press banca", 60.0)]
+
+
+def test_partial_import_still_schedules_stats(musclegain, client, monkeypatch):
+    monkeypatch.setattr(musclegain, "import_workouts", functools.partial(importer.import_workouts, chunk_sets=1))
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+
+    resp = post(client, ndjson(workout(1, "Sentadilla", 100), workout(2, "Sentadilla", 105), tail="{roto\n"))
+    assert resp.status_code == 400
+    with musclegain.app.app_context():
+        # La segunda sesion sigue abierta cuando aparece la linea rota.
+        assert musclegain.get_db().execute("SELECT COUNT(*) FROM workouts").fetchone()[0] == 1
+    assert queued_rebuilds(musclegain) == 1
+
+
+def test_nothing_written_schedules_nothing(musclegain, client):
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+    resp = post(client, ndjson(tail="{roto\n"))
+    assert resp.status_code == 400
+    resp = post(client, ndjson({"date": "ayer", "exercise": "Sentadilla"}))
+    assert resp.json["ok"] and resp.json["skipped"] == 1 and resp.json["stats_job"] is None
+    assert queued_rebuilds(musclegain) == 0
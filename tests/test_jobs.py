@@ -0,0 +1,158 @@
+import sqlite3
+import time
+
+import pytest
+
+import jobs
+from init_db import init_db
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    init_db(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def expire_lease(db, job_id):
+    db.execute("UPDATE jobs SET locked_at = ? WHERE id = ?", (jobs._now(-jobs.LEASE_SECONDS - 1), job_id))
+    db.commit()
+
+
+def status(db, job_id):
+    return db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_expired_lease_with_queued_duplicate_does_not_block_queue(db):
+    first = jobs.enqueue(db, "noop", dedup_key="k")
+    db.commit()
+    assert jobs.claim(db, "w1")[0] == first
+
+    # Mientras corre, el dedup permite encolar otro igual.
+    second = jobs.enqueue(db, "noop", dedup_key="k")
+    db.commit()
+    assert second != first
+
+    expire_lease(db, first)
+    assert jobs.claim(db, "w2")[0] == second
+    assert status(db, first) == "failed"
+
+
+def test_expired_lease_counts_against_max_attempts(db):
+    job_id = jobs.enqueue(db, "noop", max_attempts=2)
+    db.commit()
+
+    assert jobs.claim(db, "w1")[3] == 1
+    expire_lease(db, job_id)
+    assert jobs.claim(db, "w2")[3] == 2
+    expire_lease(db, job_id)
+
+    assert jobs.claim(db, "w3") is None
+    assert status(db, job_id) == "failed"
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    registry = {}
+    monkeypatch.setattr(jobs, "JOB_HANDLERS", registry)
+    monkeypatch.setattr(jobs, "JOB_LEASES", {})
+    return registry
+
+
+def test_failed_attempt_is_requeued_with_backoff(db, handlers):
+    def boom(conn, payload):
+        raise RuntimeError("x")
+
+    handlers["boom"] = boom
+    job_id = jobs.enqueue(db, "boom", max_attempts=3)
+    db.commit()
+
+    before = jobs._now(jobs.RETRY_BASE_SECONDS - 1)
+    assert jobs.run_one(db, "w1")
+    row = db.execute("SELECT status, attempts, run_after, last_error, locked_by FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row[:2] == ("queued", 1)
+    assert row[2] > before
+    assert row[3] == "RuntimeError: x"
+    assert row[4] is None
+    # Todavia no toca: el backoff lo deja fuera de la cola lista.
+    assert jobs.claim(db, "w2") is None
+
+
+def test_expired_requeue_blocked_by_dedup_keeps_queue_moving(db, handlers):
+    handlers["noop"] = lambda conn, payload: None
+    first = jobs.enqueue(db, "noop", dedup_key="k")
+    db.commit()
+    jobs.claim(db, "w1")
+    second = jobs.enqueue(db, "noop", dedup_key="k")
+    db.commit()
+    expire_lease(db, first)
+
+    assert jobs.run_one(db, "w2")
+    assert status(db, first) == "failed"
+    assert status(db, second) == "done"
+    assert "reemplazado" in db.execute("SELECT last_error FROM jobs WHERE id = ?", (first,)).fetchone()[0]
+
+
+def test_finish_does_not_overwrite_new_owner(db):
+    job_id = jobs.enqueue(db, "noop")
+    db.commit()
+    stale = jobs.claim(db, "w1")
+    expire_lease(db, job_id)
+    assert jobs.claim(db, "w2")[0] == job_id
+
+    jobs._finish(db, stale, "w1", None)
+    assert db.execute("SELECT status, locked_by FROM jobs WHERE id = ?", (job_id,)).fetchone() == ("running", "w2")
+
+    jobs._finish(db, stale, "w1", "RuntimeError: tarde")
+    assert db.execute("SELECT status, locked_by FROM jobs WHERE id = ?", (job_id,)).fetchone() == ("running", "w2")
+
+
+def test_heartbeat_renews_lease_while_handler_runs(db, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "LEASE_SECONDS", 0.4)
+    seen = {}
+
+    def slow(conn, payload):
+        started = conn.execute("SELECT locked_at FROM jobs").fetchone()[0]
+        time.sleep(0.6)
+        seen["renewed"] = conn.execute("SELECT locked_at FROM jobs").fetchone()[0] > started
+        # Pasado el lease original, otro runner no debe poder tomarlo.
+        other = sqlite3.connect(db.execute("PRAGMA database_list").fetchone()[2])
+        seen["claimed"] = jobs.claim(other, "w2")
+        other.close()
+
+    handlers["slow"] = slow
+    job_id = jobs.enqueue(db, "slow")
+    db.commit()
+    assert jobs.run_one(db, "w1")
+    assert seen == {"renewed": True, "claimed": None}
+    assert status(db, job_id) == "done"
+
+
+def test_per_kind_lease(db, handlers):
+    handlers["long"] = lambda conn, payload: None
+    jobs.JOB_LEASES["long"] = jobs.LEASE_SECONDS * 10
+    job_id = jobs.enqueue(db, "long")
+    db.commit()
+    jobs.claim(db, "w1")
+    expire_lease(db, job_id)
+
+    assert jobs.claim(db, "w2") is None
+    assert db.execute("SELECT locked_by FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] == "w1"
+
+
+def test_runner_thread_survives_unexpected_errors(monkeypatch):
+    calls = []
+
+    def flaky(db, worker):
+        calls.append(worker)
+        if len(calls) == 1:
+            raise ValueError("payload roto")
+        runner.stop()
+        return False
+
+    monkeypatch.setattr(jobs, "run_one", flaky)
+    runner = jobs.JobRunner(lambda: None, lambda db: None, threads=1, poll_s=0.01)
+    runner._loop("w1")
+    assert len(calls) == 2
@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import passwords
+from passwords import HashPool, HashPoolBusy, hash_method
+
+FAST = "pbkdf2:sha256:1000"  # el mismo FAST_HASH de conftest
+
+
+class BrokenExecutor:
+    def __init__(self):
+        self.shut = False
+
+    def submit(self, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("hijo muerto"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut = True
+
+
+class InlineExecutor(BrokenExecutor):
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def fake_pools(monkeypatch, pool, executors):
+    made = []
+
+    def make():
+        made.append(executors.pop(0))
+        pool._executor = made[-1]
+        return made[-1]
+
+    monkeypatch.setattr(pool, "_pool", make)
+    return made
+
+
+def test_busy_pool_rejects():
+    pool = HashPool(FAST, workers=0, max_pending=1, wait_s=0.01)
+    assert pool._slots.acquire()
+    try:
+        with pytest.raises(HashPoolBusy):
+            pool.hash("secreto")
+    finally:
+        pool._slots.release()
+    assert pool.rejected == 1
+    assert pool.verify(pool.hash("secreto"), "secreto")
+
+
+def test_broken_pool_is_replaced_once(monkeypatch):
+    pool = HashPool(FAST, workers=1)
+    made = fake_pools(monkeypatch, pool, [BrokenExecutor(), InlineExecutor()])
+
+    assert hash_method(pool.hash("secreto")) == FAST
+    assert made[0].shut and not made[1].shut
+    assert pool.rejected == 0
+
+
+def test_broken_pool_twice_is_busy(monkeypatch):
+    pool = HashPool(FAST, workers=1)
+    made = fake_pools(monkeypatch, pool, [BrokenExecutor(), BrokenExecutor()])
+
+    with pytest.raises(HashPoolBusy):
+        pool.verify("x", "secreto")
+    assert all(e.shut for e in made)
+    assert pool._executor is None
+    assert pool.rejected == 1
+    # El semaforo no queda tomado.
+    assert pool._slots.acquire(timeout=0)
+
+
+def test_needs_rehash():
+    pool = HashPool(FAST, workers=0)
+    assert not pool.needs_rehash(pool.hash("secreto"))
+    assert pool.needs_rehash(HashPool("pbkdf2:sha256:2000", workers=0).hash("secreto"))
+
+
+def test_default_workers():
+    assert passwords.default_workers("") == 0
+    assert passwords.default_workers("--workers 4 -k sync") == 0
+    assert passwords.default_workers("-k gthread") == 1
+    assert passwords.default_workers("--worker-class=gthread") == 1
+    assert passwords.default_workers("--threads 4") == 1
+    assert passwords.default_workers("--threads=1") == 0
+
+
+def stored_hash(musclegain, username):
+    with musclegain.app.app_context():
+        return musclegain.get_db().execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def test_login_rehashes_old_method(musclegain, client, monkeypatch):
+    assert musclegain.password_pool.workers == 0
+    assert hash_method(stored_hash(musclegain, "ana")) == FAST
+
+    monkeypatch.setattr(musclegain.password_pool, "method", "pbkdf2:sha256:2000")
+    resp = client.post("/login", data={"username": "ana", "password": "secreto"})
+    assert resp.status_code == 302
+    assert hash_method(stored_hash(musclegain, "ana")) == "pbkdf2:sha256:2000"
+
+
+def test_login_with_broken_pool_is_503(musclegain, client, monkeypatch):
+    pool = musclegain.password_pool
+    monkeypatch.setattr(pool, "workers", 1)
+    fake_pools(monkeypatch, pool, [BrokenExecutor(), BrokenExecutor()])
+    resp = client.post("/login", data={"username": "ana", "password": "secreto"})
+    assert resp.status_code == 503
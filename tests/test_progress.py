@@ -0,0 +1,34 @@
+from datetime import date
+
+
+def test_downsample_series_skips_bad_dates(musclegain):
+    days = [date(2024, 1, d).isoformat() for d in range(1, 11)]
+    series = {
+        "date": days[:5] + ["ayer", None] + days[5:],
+        "e1rm": list(range(12)),
+    }
+    assert musclegain.downsample_series(series, 20) == {
+        "date": days,
+        "e1rm": [0, 1, 2, 3, 4, 7, 8, 9, 10, 11],
+    }
+    out = musclegain.downsample_series(series, 4)
+    assert len(out["date"]) == 4 and set(out["date"]) <= set(days)
+
+
+def test_session_with_bad_date_is_stored_as_today(musclegain, client):
+    client.post("/login", data={"username": "ana", "password": "secreto"})
+    resp = client.post(
+        "/session/new",
+        data={
+            "date": "manana",
+            "exercise[]": ["Press banca"],
+            "sets[]": ["3"],
+            "reps[]": ["8"],
+            "weight[]": ["60"],
+            "set_note[]": [""],
+        },
+    )
+    assert resp.status_code == 302
+    with musclegain.app.app_context():
+        stored = musclegain.get_db().execute("SELECT date FROM workouts").fetchone()[0]
+    assert stored == date.today().isoformat()